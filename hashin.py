@@ -1,19 +1,23 @@
 #!/usr/bin/env python
-# -*- coding: utf-8 -*-
 
 """
 See README :)
 """
 
-from __future__ import print_function
 import argparse
+import copy
 import difflib
-from email.headerregistry import HeaderRegistry
+import functools
+import hashlib
 import tempfile
 import os
+from contextlib import contextmanager
 import re
+import shutil
 import sys
-import json
+import threading
+import time
+from collections import namedtuple
 from itertools import chain
 import concurrent.futures
 
@@ -26,11 +30,28 @@ from urllib.request import urlopen
 from urllib.error import HTTPError
 from urllib.parse import urljoin
 
+try:
+    # Optional, but much faster at parsing large PyPI JSON payloads.
+    import orjson as json
+except ImportError:
+    import json
+
 DEFAULT_ALGORITHM = "sha256"
 
+# The hash algorithms pip accepts in --hash.
+SUPPORTED_ALGORITHMS = ("sha256", "sha384", "sha512")
+
 DEFAULT_INDEX_URL = os.environ.get("INDEX_URL", "https://pypi.org/")
 assert DEFAULT_INDEX_URL
 
+# Package JSON fetched from the index is re-used from ~/.cache/hashin for
+# this many seconds. Set HASHIN_NO_CACHE to always fetch it fresh.
+METADATA_CACHE_TTL = 0 if os.environ.get("HASHIN_NO_CACHE") else 300
+
+# The most packages looked up at the same time, and the most release files
+# downloaded at the same time, however many packages they're for.
+MAX_WORKERS = 8
+
 major_pip_version = int(pip_api.version().split(".")[0])
 if major_pip_version < 8:
     raise ImportError("hashin only works with pip 8.x or greater")
@@ -49,13 +70,12 @@ class PackageNotFoundError(Exception):
 
 
 def _verbose(*args):
-    print("* " + " ".join(args))
+    print("* " + " ".join(str(arg) for arg in args))
 
 
-_header_registry = HeaderRegistry()
-
-
-def _download(url, binary=False):
+def _urlopen(url):
+    """Open `url`, raising PackageNotFoundError or PackageError unless it's
+    a 200 response."""
     try:
         r = urlopen(url)
     except HTTPError as exception:
@@ -70,27 +90,77 @@ def _download(url, binary=False):
         raise PackageNotFoundError(url)
     elif status_code != 200:
         raise PackageError("Download error. {0} on {1}".format(status_code, url))
-    if binary:
-        return r.read()
-    content_type = _header_registry("content-type", r.headers.get("Content-Type", ""))
-    encoding = content_type.params.get("charset", "utf-8")
-    return r.read().decode(encoding)
+    return r
+
+
+def _download(url):
+    """Return the response body of `url` as bytes."""
+    return _urlopen(url).read()
+
+
+@contextmanager
+def _open_requirements(file, mode="r"):
+    """Open the requirements file, unless it's already a file-like object
+    (e.g. an `io.StringIO`), in which case that's rewound and used as is.
+
+    When writing to a path, everything goes to a temporary file next to it
+    which then replaces the original in one go. That way an error halfway
+    through never leaves a truncated requirements file behind."""
+    if hasattr(file, "read"):
+        file.seek(0)
+        if "w" in mode:
+            file.truncate()
+        yield file
+    elif "w" in mode:
+        # Resolve symlinks so that it's the file they point to that's replaced.
+        path = os.path.realpath(file)
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(path), prefix=".hashin-", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, mode) as f:
+                yield f
+            if os.path.exists(path):
+                shutil.copymode(path, tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+    else:
+        with open(file, mode) as f:
+            yield f
+
+
+# A requirements file line that pins something.
+PINNED_LINE_RE = re.compile(r"(^|\n|\n\r).*==")
+
+
+@functools.lru_cache(maxsize=1024)
+def _cached_requirement(spec):
+    return Requirement(spec)
+
+
+def _parse_requirement(spec):
+    """Return a `Requirement` for `spec`, only running the parser once for
+    each distinct spec. The callers set attributes like `.name` on what they
+    get back, so each gets its own (shallow) copy."""
+    return copy.copy(_cached_requirement(spec))
 
 
 def run(specs, requirements_file, *args, **kwargs):
     if not specs:  # then, assume all in the requirements file
-        regex = re.compile(r"(^|\n|\n\r).*==")
         specs = []
         previous_versions = {}
-        with open(requirements_file) as f:
+        with _open_requirements(requirements_file) as f:
             for line in f:
-                if regex.search(line) and not line.lstrip().startswith("#"):
-                    req = Requirement(line.split("\\")[0])
+                if PINNED_LINE_RE.search(line) and not line.lstrip().startswith("#"):
+                    req = _parse_requirement(line.split("\\")[0])
                     # Deliberately strip the specifier (aka. the version)
                     version = req.specifier
                     req.specifier = None
-                    specs.append(str(req))
-                    previous_versions[str(req)] = version
+                    spec = str(req)
+                    specs.append(spec)
+                    previous_versions[spec] = version
         kwargs["previous_versions"] = previous_versions
 
     if isinstance(specs, str):
@@ -99,10 +169,17 @@ def run(specs, requirements_file, *args, **kwargs):
     return run_packages(specs, requirements_file, *args, **kwargs)
 
 
+# A plain PEP 508 distribution name, with no extras, specifiers or markers.
+# Most specs look like this and don't need the full `Requirement` parser.
+SIMPLE_PACKAGE_NAME_RE = re.compile(r"^[A-Za-z0-9]([A-Za-z0-9._-]*[A-Za-z0-9])?$")
+
+
 def _explode_package_spec(spec):
     restriction = None
     if ";" in spec:
-        spec, restriction = [x.strip() for x in spec.split(";", 1)]
+        # The environment marker is passed through as is, quotes and all.
+        spec, _, restriction = spec.partition(";")
+        spec, restriction = spec.strip(), restriction.strip()
     if "==" in spec:
         package, version = spec.split("==")
     else:
@@ -126,19 +203,48 @@ def run_packages(
 ):
     assert index_url
     assert isinstance(specs, list), type(specs)
+    algorithms = _split_algorithms(algorithm)
     all_new_lines = []
     first_interactive = True
     yes_to_all = False
 
-    lookup_memory = {}
-    if not synchronous and len(specs) > 1:
-        pre_download_packages(
-            lookup_memory, specs, verbose=verbose, index_url=index_url
-        )
-
+    parsed_specs = []
     for spec in specs:
         package, version, restriction = _explode_package_spec(spec)
+        # Only bother parsing it as a proper `Requirement` if it's something
+        # more complex than a plain name, like "requests[security]".
+        if SIMPLE_PACKAGE_NAME_RE.match(package):
+            req = None
+        else:
+            req = _parse_requirement(package)
+        parsed_specs.append((package, version, restriction, req))
+
+    def lookup(parsed_spec):
+        package, version, _, req = parsed_spec
+        return get_package_hashes(
+            package=req.name if req else package,
+            version=version,
+            verbose=verbose,
+            python_versions=python_versions,
+            algorithm=algorithm,
+            include_prereleases=include_prereleases,
+            index_url=index_url,
+            synchronous=synchronous,
+        )
 
+    if not synchronous and len(parsed_specs) > 1:
+        # Each lookup is mostly waiting on the network, so do them all at
+        # once. `executor.map` still hands back the results in order.
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=min(len(parsed_specs), MAX_WORKERS)
+        ) as executor:
+            # If a lookup fails, `executor.map` cancels the ones that haven't
+            # started yet, so there's no waiting for them.
+            all_data = list(executor.map(lookup, parsed_specs))
+    else:
+        all_data = map(lookup, parsed_specs)
+
+    for (package, version, restriction, req), data in zip(parsed_specs, all_data):
         # It's important to keep a track of what the package was called before
         # so that if we have to amend the requirements file, we know what to
         # look for before.
@@ -149,25 +255,14 @@ def run_packages(
         # is figured out.
         previous_version = previous_versions.get(package) if previous_versions else None
 
-        req = Requirement(package)
-
-        data = get_package_hashes(
-            package=req.name,
-            version=version,
-            verbose=verbose,
-            python_versions=python_versions,
-            algorithm=algorithm,
-            include_prereleases=include_prereleases,
-            lookup_memory=lookup_memory,
-            index_url=index_url,
-        )
         package = data["package"]
         # We need to keep this `req` instance for the sake of turning it into a string
         # the correct way. But, the name might actually be wrong. Suppose the user
         # asked for "Django" but on PyPI it's actually called "django", then we want
         # correct that.
         # We do that by modifying only the `name` part of the `Requirement` instance.
-        req.name = package
+        if req:
+            req.name = package
 
         if previous_versions is None:
             # Need to be smart here. It's a little counter-intuitive.
@@ -208,13 +303,17 @@ def run_packages(
                 return 1
 
         maybe_restriction = "" if not restriction else "; {0}".format(restriction)
-        new_lines = "{0}=={1}{2} \\\n".format(req, data["version"], maybe_restriction)
-        padding = " " * 4
-        for i, release in enumerate(data["hashes"]):
-            new_lines += "{0}--hash={1}:{2}".format(padding, algorithm, release["hash"])
-            if i != len(data["hashes"]) - 1:
-                new_lines += " \\"
-            new_lines += "\n"
+        parts = [
+            "{0}=={1}{2}".format(req or package, data["version"], maybe_restriction)
+        ]
+        for release in data["hashes"]:
+            # With just the one algorithm, the hashes don't say which it is.
+            parts.append(
+                "    --hash={0}:{1}".format(
+                    release.get("algorithm", algorithms[0]), release["hash"]
+                )
+            )
+        new_lines = " \\\n".join(parts) + "\n"
         all_new_lines.append((package, previous_name, new_lines))
 
     if not all_new_lines:
@@ -222,7 +321,7 @@ def run_packages(
         # if every single package you listed already has the latest version.
         return 0
 
-    with open(file) as f:
+    with _open_requirements(file) as f:
         old_requirements = f.read()
     requirements = amend_requirements_content(old_requirements, all_new_lines)
     if dry_run:
@@ -239,7 +338,7 @@ def run_packages(
             )
         )
     else:
-        with open(file, "w") as f:
+        with _open_requirements(file, "w") as f:
             f.write(requirements)
         if verbose:
             _verbose("Editing", file)
@@ -247,18 +346,15 @@ def run_packages(
     return 0
 
 
-def pre_download_packages(memory, specs, verbose=False, index_url=DEFAULT_INDEX_URL):
-    futures = {}
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        for spec in specs:
-            package, _, _ = _explode_package_spec(spec)
-            req = Requirement(package)
-            futures[
-                executor.submit(get_package_data, req.name, index_url, verbose=verbose)
-            ] = req.name
-        for future in concurrent.futures.as_completed(futures):
-            content = future.result()
-            memory[futures[future]] = content
+# What each answer to the interactive "Update?" question means.
+INTERACTIVE_ANSWERS = {
+    "": "YES",
+    "y": "YES",
+    "yes": "YES",
+    "n": "NO",
+    "a": "ALL",
+    "q": "QUIT",
+}
 
 
 def interactive_upgrade_request(
@@ -306,37 +402,26 @@ def interactive_upgrade_request(
         )
         printed_help.append(1)
 
-    def clear_line():
-        sys.stdout.write("\033[F")  # Cursor up one line
-        sys.stdout.write("\033[K")  # Clear to the end of line
+    def clear_lines(count):
+        # Cursor up one line and clear to the end of it, `count` times over,
+        # in a single write.
+        sys.stdout.write("\033[F\033[K" * count)
 
     def ask():
         answer = input("Update? [Y/n/a/q/?]: ").lower().strip()
         if printed_help:
             # Because the print_help() prints 5 lines to stdout.
             # Plus 2 because of the original question line and the extra blank line.
-            for i in range(5 + 2):
-                clear_line()
-            # printed_help.clear()
-            del printed_help[:]
-
-        if answer == "n":
-            clear_line()
-            clear_line()
-            print_line(False)
-            return "NO"
-        if answer == "a":
-            clear_line()
-            clear_line()
-            print_line(True)
-            return "ALL"
-        if answer == "q":
-            return "QUIT"
-        if answer == "y" or answer == "" or answer == "yes":
-            clear_line()
-            clear_line()
-            print_line(True)
-            return "YES"
+            clear_lines(5 + 2)
+            printed_help.clear()
+
+        action = INTERACTIVE_ANSWERS.get(answer)
+        if action == "QUIT":
+            return action
+        if action:
+            clear_lines(2)
+            print_line(action != "NO")
+            return action
         if answer == "?":
             print_help()
 
@@ -345,76 +430,140 @@ def interactive_upgrade_request(
     return ask()
 
 
+NON_EMPTY_LINE_RE = re.compile(r"^(.+)$", re.MULTILINE)
+
+# Each line, without its "\n" or "\r\n" ending.
+LINE_RE = re.compile(r"^([^\r\n]*)\r?$", re.MULTILINE)
+
+
+def _is_different_lines(old_lines, new_lines, indent):
+    # This assumes that the package is already mentioned in the old
+    # requirements. Now we just need to double-check that its lines are
+    # different.
+    # The 'new_lines` is what we might intend to replace it with.
+    # The names in the old lines are only temporarily normalized, so that
+    # "old" names match "new" names and hashin correctly replaces them.
+    old = {line.strip(" \\").replace("_", "-") for line in old_lines}
+    new = {indent + x.strip(" \\") for x in new_lines}
+    return old != new
+
+
+def _normalize_name(name):
+    return name.lower().replace("_", "-")
+
+
+def _pinned_names(text):
+    """Return the normalized names of everything pinned with "==" in `text`.
+    Names that used to be pinned but since got replaced can be left in, as
+    long as all the ones `_pinned_package_regex` would find are in there."""
+    names = set()
+    for line in text.splitlines():
+        name, pinned, _ = line.partition("==")
+        if pinned:
+            names.add(_normalize_name(name.lstrip(" \t").partition("[")[0]))
+    return names
+
+
+@functools.lru_cache(maxsize=256)
+def _pinned_package_regex(name):
+    """Return a compiled regex that finds where `name` is pinned, e.g.
+    "name==1.0" or "name[extra]==1.0", in a requirements file."""
+    # The call to `escape` will turn hyphens into escaped hyphens
+    #
+    # ex.
+    #   -       becomes     \\-
+    #
+    escaped = re.escape(name)
+
+    # This changes those escaped hypens into a pattern to match
+    #
+    # ex.
+    #   \\-     becomes     [-_]
+    #
+    # This is necessary so that hashin will correctly find underscored (old)
+    # and hyphenated (new) package names so that it will correctly replace an
+    # old name with the new name when there is a version update.
+    escape_replaced = escaped.replace("\\-", "[-_]")
+    return re.compile(
+        r"^(?P<indent>[ \t]*){0}(\[.*\])?==".format(escape_replaced),
+        re.IGNORECASE | re.MULTILINE,
+    )
+
+
+def _append_lines(requirements, new_lines):
+    """Add each of `new_lines` to the bottom of `requirements`, stripping
+    the text before each one, but without copying it for each one."""
+    if requirements:
+        requirements = requirements.strip() + "\n"
+    requirements += "".join(new_lines[:-1])
+    if requirements:
+        requirements = requirements.strip() + "\n"
+    return requirements + new_lines[-1]
+
+
 def amend_requirements_content(requirements, all_new_lines):
     # I wish we had types!
     assert isinstance(all_new_lines, list), type(all_new_lines)
 
     padding = " " * 4
-
-    def is_different_lines(old_lines, new_lines, indent):
-        # This regex is used to only temporarily normalize the names of packages
-        # in the lines being compared. This results in "old" names matching
-        # "new" names so that hashin correctly replaces them when it looks for
-        # them.
-        match_delims = re.compile(r"[-_]")
-
-        # This assumes that the package is already mentioned in the old
-        # requirements. Now we just need to double-check that its lines are
-        # different.
-        # The 'new_lines` is what we might intend to replace it with.
-        old = set([match_delims.sub("-", line.strip(" \\")) for line in old_lines])
-        new = set([indent + x.strip(" \\") for x in new_lines])
-        return old != new
+    # Everything that's pinned in the file, looked up before searching with
+    # the regex. When adding new packages that would otherwise have to scan
+    # the whole file just to find nothing.
+    pinned = _pinned_names(requirements)
+    # New packages for the bottom of the file. They're all added in one go,
+    # rather than copying the whole file every time another one is added.
+    appended = []
 
     for package, old_name, new_text in all_new_lines:
-        # The call to `escape` will turn hyphens into escaped hyphens
-        #
-        # ex.
-        #   -       becomes     \\-
-        #
-        escaped = re.escape(old_name)
-
-        # This changes those escaped hypens into a pattern to match
-        #
-        # ex.
-        #   \\-     becomes     [-_]
-        #
-        # This is necessary so that hashin will correctly find underscored (old)
-        # and hyphenated (new) package names so that it will correctly replace an
-        # old name with the new name when there is a version update.
-        escape_replaced = escaped.replace("\\-", "[-_]")
-        regex = re.compile(
-            r"^(?P<indent>[ \t]*){0}(\[.*\])?==".format(escape_replaced),
-            re.IGNORECASE | re.MULTILINE,
-        )
+        if _normalize_name(old_name.partition("[")[0]) in pinned:
+            if appended:
+                requirements = _append_lines(requirements, appended)
+                appended = []
+            match = _pinned_package_regex(old_name).search(requirements)
+        else:
+            match = None
         # if the package wasn't already there, add it to the bottom
-        match = regex.search(requirements)
         if not match:
             # easy peasy
-            if requirements:
-                requirements = requirements.strip() + "\n"
-            requirements += new_text.strip() + "\n"
+            appended.append(new_text.strip() + "\n")
+            pinned.update(_pinned_names(new_text))
         else:
             indent = match.group("indent")
+            # Build these once per package rather than once per line.
+            continuation_prefix = indent + padding
+            comment_prefix = continuation_prefix + "#"
             lines = []
-            for line in requirements.splitlines():
-                if regex.search(line):
+            # The regex search above already found where the package's block
+            # starts, so there's no need to look at any of the lines before it.
+            regex = match.re
+            # The block is only a few lines long, so rather than splitting up
+            # the whole rest of the file, let the regex engine find one line
+            # at a time.
+            for line_match in LINE_RE.finditer(requirements, match.start()):
+                line = line_match.group(1)
+                # Most lines are "--hash=..." continuations or comments, and
+                # those can't match without the "==", so skip the regex.
+                if "==" in line and regex.search(line):
                     lines.append(line)
-                elif lines and line.startswith(indent + padding + "#"):
+                elif lines and line.startswith(comment_prefix):
                     break
-                elif lines and line.startswith(indent + padding):
+                elif lines and line.startswith(continuation_prefix):
                     lines.append(line)
                 elif lines:
                     break
-            if is_different_lines(lines, new_text.splitlines(), indent):
+            if _is_different_lines(lines, new_text.splitlines(), indent):
                 # need to replace the existing
                 combined = "\n".join(lines + [""])
-                # indent non-empty lines
-                indented = re.sub(
-                    r"^(.+)$", r"{0}\1".format(indent), new_text, flags=re.MULTILINE
-                )
+                # indent non-empty lines, if there's any indentation at all
+                if indent:
+                    indented = NON_EMPTY_LINE_RE.sub(r"{0}\1".format(indent), new_text)
+                else:
+                    indented = new_text
                 requirements = requirements.replace(combined, indented)
+                pinned.update(_pinned_names(indented))
 
+    if appended:
+        requirements = _append_lines(requirements, appended)
     return requirements
 
 
@@ -445,7 +594,6 @@ def get_latest_version(data, include_prereleases):
             all_versions.append((v, version))
         else:
             count_prereleases += 1
-    all_versions.sort(reverse=True)
     if not all_versions:
         msg = "No valid version found."
         if not include_prereleases and count_prereleases:
@@ -454,19 +602,25 @@ def get_latest_version(data, include_prereleases):
                 "with the --include-prereleases flag.".format(count_prereleases)
             )
         raise NoVersionsError(msg)
-    # return the highest non-pre-release version
-    return str(all_versions[0][1])
+    # return the highest non-pre-release version, no need to sort them all
+    return str(max(all_versions)[1])
+
 
+PYTHON_VERSION_RE = re.compile(r"^\d\.\d{1,2}$")
 
+
+@functools.lru_cache(maxsize=None)
 def expand_python_version(version):
     """
     Expand Python versions to all identifiers used on PyPI.
 
-    >>> expand_python_version('3.5')
+    >>> sorted(expand_python_version('3.5'))
     ['3.5', 'cp35', 'py2.py3', 'py3', 'py3.5', 'py35', 'source']
     """
-    if not re.match(r"^\d\.\d{1,2}$", version):
-        return [version]
+    # Only a handful of different versions are ever asked for, so the
+    # results are cached. They're frozensets so that's safe.
+    if not PYTHON_VERSION_RE.match(version):
+        return frozenset([version])
 
     major, minor = version.split(".")
     patterns = [
@@ -478,7 +632,7 @@ def expand_python_version(version):
         "source",
         "py2.py3",
     ]
-    return set(pattern.format(major=major, minor=minor) for pattern in patterns)
+    return frozenset(pattern.format(major=major, minor=minor) for pattern in patterns)
 
 
 # This should match the naming convention laid out in PEP 0427
@@ -536,83 +690,243 @@ CLASSIFY_EXE_RE = re.compile(
 )
 
 
-def release_url_metadata(url):
-    filename = url.split("/")[-1]
-    defaults = {
-        "package": None,
-        "version": None,
-        "python_version": None,
-        "abi": None,
-        "platform": None,
-        "format": None,
-    }
-    simple_classifiers = [CLASSIFY_WHEEL_RE, CLASSIFY_EGG_RE, CLASSIFY_EXE_RE]
-    for classifier in simple_classifiers:
+# Each classifier can only ever match filenames that end with its format, so
+# there's no need to try (and backtrack through) the others.
+SIMPLE_CLASSIFIERS = {
+    "whl": CLASSIFY_WHEEL_RE,
+    "egg": CLASSIFY_EGG_RE,
+    "exe": CLASSIFY_EXE_RE,
+    "msi": CLASSIFY_EXE_RE,
+}
+
+
+_ReleaseURLMetadata = namedtuple(
+    "ReleaseURLMetadata", "package version python_version abi platform format"
+)
+_NO_METADATA = _ReleaseURLMetadata(None, None, None, None, None, None)
+
+
+@functools.lru_cache(maxsize=1024)
+def _classify_release_url(url):
+    filename = url.rpartition("/")[2]
+    classifier = SIMPLE_CLASSIFIERS.get(filename.partition("#")[0][-3:])
+    if classifier:
         match = classifier.match(filename)
         if match:
-            defaults.update(match.groupdict())
-            return defaults
-
-    match = CLASSIFY_ARCHIVE_RE.match(filename)
-    if match:
-        defaults.update(match.groupdict())
-        defaults["python_version"] = "source"
-        return defaults
+            return _NO_METADATA._replace(**match.groupdict())
+    else:
+        match = CLASSIFY_ARCHIVE_RE.match(filename)
+        if match:
+            return _NO_METADATA._replace(python_version="source", **match.groupdict())
 
     raise PackageError("Unrecognizable url: " + url)
 
 
+def release_url_metadata(url):
+    return _classify_release_url(url)._asdict()
+
+
 def filter_releases(releases, python_versions):
-    python_versions = list(
+    python_versions = frozenset(
         chain.from_iterable(expand_python_version(v) for v in python_versions)
     )
-    filtered = []
-    for release in releases:
-        metadata = release_url_metadata(release["url"])
-        if metadata["python_version"] in python_versions:
-            filtered.append(release)
-    return filtered
+    return [
+        release
+        for release in releases
+        if _classify_release_url(release["url"]).python_version in python_versions
+    ]
+
+
+def _metadata_cache_filename(url):
+    # Not the temp directory, because anyone can write there and these files
+    # are trusted to have the right hashes in them.
+    cache_dir = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, "hashin", "{0}.json".format(key))
+
+
+def _read_cached_metadata(filename):
+    """Return the cached bytes if they're recent enough, otherwise None."""
+    if not METADATA_CACHE_TTL:
+        return None
+    try:
+        if time.time() - os.path.getmtime(filename) < METADATA_CACHE_TTL:
+            with open(filename, "rb") as f:
+                return f.read()
+    except OSError:
+        pass
+    return None
+
+
+def _write_cached_metadata(filename, raw):
+    try:
+        # Only the user can write to it, since the hashes in it are trusted.
+        os.makedirs(os.path.dirname(filename), mode=0o700, exist_ok=True)
+        # Write to a temporary file first so that a concurrent hashin never
+        # reads a half-written file.
+        fd, tmp_filename = tempfile.mkstemp(dir=os.path.dirname(filename))
+    except OSError:
+        # Not being able to cache is no reason to fail.
+        return
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(raw)
+        os.replace(tmp_filename, filename)
+    except OSError:
+        os.remove(tmp_filename)
+
+
+def _parse_package_data(raw):
+    # Both json and orjson can parse the raw bytes directly, which
+    # saves decoding the (potentially multi-megabyte) payload first.
+    content = json.loads(raw)
+    if "releases" not in content:
+        raise PackageError("package JSON is not sane")
+    return content
 
 
 def get_package_data(package, index_url, verbose=False):
     path = "/pypi/%s/json" % package
     url = urljoin(index_url, path)
     if verbose:
-        print(url)
-    content = json.loads(_download(url))
-    if "releases" not in content:
-        raise PackageError("package JSON is not sane")
+        _verbose("Package data", url)
+    cache_filename = _metadata_cache_filename(url)
+    raw = _read_cached_metadata(cache_filename)
+    if raw is not None:
+        try:
+            content = _parse_package_data(raw)
+        except (ValueError, PackageError):
+            # Cut short or otherwise broken, so fetch it again instead.
+            try:
+                os.remove(cache_filename)
+            except OSError:
+                pass
+        else:
+            if verbose:
+                _verbose("  Re-using", cache_filename)
+            return content
 
+    raw = _download(url)
+    content = _parse_package_data(raw)
+    if METADATA_CACHE_TTL:
+        _write_cached_metadata(cache_filename, raw)
     return content
 
 
-def get_releases_hashes(releases, algorithm, verbose=False):
+def _split_algorithms(algorithm):
+    """Turn something like "sha256,sha512" into ["sha256", "sha512"]."""
+    if isinstance(algorithm, str):
+        algorithms = [x.strip() for x in algorithm.split(",") if x.strip()]
+    else:
+        algorithms = list(algorithm)
+    if not algorithms:
+        raise PackageError("No hash algorithm given")
+    for name in algorithms:
+        if name not in SUPPORTED_ALGORITHMS:
+            raise PackageError(
+                "Unsupported hash algorithm {0!r}, use one of {1}".format(
+                    name, ", ".join(SUPPORTED_ALGORITHMS)
+                )
+            )
+    if len(set(algorithms)) != len(algorithms):
+        raise PackageError("Each hash algorithm can only be given once")
+    return algorithms
+
+
+def _hash_file(filename, algorithms):
+    """Return a dict of hex digests, one for each algorithm, from reading the
+    file only once."""
+    hashers = [hashlib.new(name) for name in algorithms]
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b""):
+            for hasher in hashers:
+                hasher.update(chunk)
+    return {name: hasher.hexdigest() for name, hasher in zip(algorithms, hashers)}
+
+
+# Each lookup downloads its release files in a pool of its own, and the
+# lookups run in a pool too. All the downloads share these slots so there
+# are never more than MAX_WORKERS of them at once.
+_download_slots = threading.BoundedSemaphore(MAX_WORKERS)
+
+
+def _download_release(url):
+    """Download the release file into the temp directory, unless it's already
+    there. Returns the filename and whether it had to be downloaded."""
+    download_dir = tempfile.gettempdir()
+    filename = os.path.join(download_dir, os.path.basename(url.split("#")[0]))
+    if os.path.isfile(filename):
+        return filename, False
+    with _download_slots:
+        r = _urlopen(url)
+        # Stream the body to disk rather than holding the whole release in
+        # memory. It goes to a temporary file first so that an interrupted
+        # download is never mistaken for a complete one next time.
+        fd, tmp_filename = tempfile.mkstemp(dir=download_dir, prefix=".hashin-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                shutil.copyfileobj(r, f, 64 * 1024)
+            os.replace(tmp_filename, filename)
+        except BaseException:
+            os.remove(tmp_filename)
+            raise
+    return filename, True
+
+
+def get_releases_hashes(releases, algorithm, verbose=False, synchronous=False):
+    algorithms = _split_algorithms(algorithm)
+
+    # Any release whose digests doesn't have all the algorithms has to be
+    # downloaded. If there are several of those, download them in parallel.
+    downloaded = {}
+    to_download = [
+        found["url"]
+        for found in releases
+        if any(name not in found["digests"] for name in algorithms)
+    ]
+    if not synchronous and len(to_download) > 1:
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=min(len(to_download), MAX_WORKERS)
+        ) as executor:
+            futures = {
+                executor.submit(_download_release, url): url for url in to_download
+            }
+            for future in concurrent.futures.as_completed(futures):
+                downloaded[futures[future]] = future.result()
+
     for found in releases:
         digests = found["digests"]
-        try:
-            found["hash"] = digests[algorithm]
+        hashes = {name: digests[name] for name in algorithms if name in digests}
+        missing = [name for name in algorithms if name not in hashes]
+        if not missing:
             if verbose:
                 _verbose("Found hash for", found["url"])
-        except KeyError:
-            # The algorithm is NOT in the 'digests' dict.
-            # We have to download the file and use pip
+        else:
+            # At least one algorithm is NOT in the 'digests' dict.
+            # We have to download the file and hash it ourselves.
             url = found["url"]
             if verbose:
                 _verbose("Found URL", url)
-            download_dir = tempfile.gettempdir()
-            filename = os.path.join(download_dir, os.path.basename(url.split("#")[0]))
-            if not os.path.isfile(filename):
-                if verbose:
+            if url in downloaded:
+                filename, was_downloaded = downloaded[url]
+            else:
+                filename, was_downloaded = _download_release(url)
+            if verbose:
+                if was_downloaded:
                     _verbose("  Downloaded to", filename)
-                with open(filename, "wb") as f:
-                    f.write(_download(url, binary=True))
-            elif verbose:
-                _verbose("  Re-using", filename)
+                else:
+                    _verbose("  Re-using", filename)
 
-            found["hash"] = pip_api.hash(filename, algorithm)
-        if verbose:
-            _verbose("  Hash", found["hash"])
-        yield {"hash": found["hash"]}
+            hashes.update(_hash_file(filename, missing))
+        for name in algorithms:
+            if verbose:
+                _verbose("  Hash", hashes[name])
+            if len(algorithms) == 1:
+                yield {"hash": hashes[name]}
+            else:
+                yield {"algorithm": name, "hash": hashes[name]}
 
 
 def get_package_hashes(
@@ -624,6 +938,7 @@ def get_package_hashes(
     include_prereleases=False,
     lookup_memory=None,
     index_url=DEFAULT_INDEX_URL,
+    synchronous=False,
 ):
     """
     Gets the hashes for the given package.
@@ -680,8 +995,13 @@ def get_package_hashes(
             raise PackageError("No releases could be found for {0}".format(version))
 
     hashes = sorted(
-        get_releases_hashes(releases=releases, algorithm=algorithm, verbose=verbose),
-        key=lambda r: r["hash"],
+        get_releases_hashes(
+            releases=releases,
+            algorithm=algorithm,
+            verbose=verbose,
+            synchronous=synchronous,
+        ),
+        key=lambda r: (r.get("algorithm", ""), r["hash"]),
     )
     return {"package": package, "version": version, "hashes": hashes}
 
@@ -702,7 +1022,10 @@ def get_parser():
     parser.add_argument(
         "-a",
         "--algorithm",
-        help="The hash algorithm to use: one of sha256, sha384, sha512",
+        help=(
+            "The hash algorithm to use: one of sha256, sha384, sha512. "
+            "Separate with commas to use several (e.g. sha256,sha512)"
+        ),
         default=DEFAULT_ALGORITHM,
     )
     parser.add_argument("-v", "--verbose", help="Verbose output", action="store_true")
@@ -30,7 +30,7 @@ setup(
     install_requires=["packaging", "pip-api"],
     tests_require=["pytest"],
     setup_requires=["pytest-runner"],
-    extras_require={"dev": ["tox", "twine"]},
+    extras_require={"dev": ["tox", "twine"], "speedups": ["orjson"]},
     classifiers=[
         "Intended Audience :: Developers",
         "Intended Audience :: System Administrators",
@@ -1,16 +1,36 @@
-import os
-from tempfile import mkdtemp
-from contextlib import contextmanager
-from shutil import rmtree
+import io
 from unittest import mock
 
 import pytest
 
+import hashin
 
-@pytest.fixture
-def murlopen():
-    with mock.patch("hashin.urlopen") as patch:
-        yield patch
+
+@pytest.fixture(autouse=True)
+def no_metadata_cache():
+    # Otherwise package JSON mocked in one test could be re-used in another.
+    with mock.patch("hashin.METADATA_CACHE_TTL", 0):
+        yield
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    # Start every test without anything hashin memoized in a previous one.
+    for value in vars(hashin).values():
+        # Only hashin's own, not anything it imported, like urlsplit.
+        if getattr(value, "__module__", None) == "hashin" and hasattr(
+            value, "cache_clear"
+        ):
+            value.cache_clear()
+
+
+@pytest.fixture(autouse=True)
+def download_dir(tmp_path_factory):
+    # Release files are downloaded to, and re-used from, the temp directory.
+    # Give each test an empty one of its own.
+    path = tmp_path_factory.mktemp("downloads")
+    with mock.patch("hashin.tempfile.tempdir", str(path)):
+        yield path
 
 
 @pytest.fixture
@@ -32,13 +52,54 @@ def mock_run():
 
 
 @pytest.fixture
-def tmpfile():
-    @contextmanager
-    def inner(name="requirements.txt"):
-        dir_ = mkdtemp("hashintest")
-        try:
-            yield os.path.join(dir_, name)
-        finally:
-            rmtree(dir_)
-
-    return inner
+def mock_input():
+    with mock.patch("hashin.input") as patch:
+        yield patch
+
+
+@pytest.fixture
+def requirements_file():
+    # hashin.run() accepts file-like objects too, so most tests have no
+    # need to touch the disk.
+    return io.StringIO()
+
+
+class _URLMock(dict):
+    """A URL -> response table that acts as a drop-in for `urlopen`.
+
+    Register responses with ``pypi_mock[url] = _Response(...)``. If the
+    registered value is an exception, it's raised instead of returned.
+    Every URL asked for is appended to ``pypi_mock.calls``.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.prefixes = []
+        self.calls = []
+
+    def register_prefix(self, prefix, handler):
+        """Respond with ``handler(url)`` to any URL that starts with `prefix`
+        and isn't registered exactly. The longest matching prefix wins."""
+        self.prefixes.append((prefix, handler))
+        self.prefixes.sort(key=lambda pair: len(pair[0]), reverse=True)
+
+    def __call__(self, url, **options):
+        self.calls.append(url)
+        response = self.get(url)
+        if response is None:
+            for prefix, handler in self.prefixes:
+                if url.startswith(prefix):
+                    response = handler(url)
+                    break
+            else:
+                raise NotImplementedError(url)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+@pytest.fixture
+def pypi_mock():
+    urls = _URLMock()
+    with mock.patch("hashin.urlopen", side_effect=urls):
+        yield urls
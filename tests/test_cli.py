@@ -1,8 +1,15 @@
-# -*- coding: utf-8 -*-
-
 import argparse
+import concurrent.futures
+import functools
+import io
 import json
+import os
+import re
+import threading
+import time
+from importlib import metadata
 from unittest import mock
+from urllib.error import HTTPError
 
 import pytest
 from packaging.requirements import Requirement
@@ -10,52 +17,147 @@ from packaging.requirements import Requirement
 import hashin
 
 
-from urllib.error import HTTPError
-
+class _Response:
+    __slots__ = ("content", "status_code", "headers", "_body")
 
-class _Response(object):
     def __init__(self, content, status_code=200, headers=None):
-        if isinstance(content, dict):
-            content = json.dumps(content).encode("utf-8")
+        # A dict is only serialized the first time it's read, and then kept,
+        # so shared module-level responses are encoded at most once.
         self.content = content
         self.status_code = status_code
         if headers is None:
             headers = {"Content-Type": "text/html"}
         self.headers = headers
-
-    def read(self):
-        return self.content
+        self._body = None
+
+    def read(self, amt=None):
+        if isinstance(self.content, dict):
+            self.content = json.dumps(self.content).encode("utf-8")
+        if amt is None:
+            return self.content
+        # Sized reads stream through the body once, like a real response.
+        if self._body is None:
+            self._body = io.BytesIO(self.content)
+        return self._body.read(amt)
 
     def getcode(self):
         return self.status_code
 
 
-def test_get_latest_version_simple(murlopen):
+def _hashin_010_payload(index_url):
+    """The hashin 0.10 release as `index_url`'s JSON API would list it."""
+    return {
+        "info": {"version": "0.10", "name": "hashin"},
+        "releases": {
+            "0.10": [
+                {
+                    "url": f"{index_url}packages/2.7/p/hashin/hashin-0.10-py2-none-any.whl",
+                    "digests": {"sha256": "aaaaa"},
+                },
+                {
+                    "url": f"{index_url}packages/3.3/p/hashin/hashin-0.10-py3-none-any.whl",
+                    "digests": {"sha256": "bbbbb"},
+                },
+                {
+                    "url": f"{index_url}packages/source/p/hashin/hashin-0.10.tar.gz",
+                    "digests": {"sha256": "ccccc"},
+                },
+            ]
+        },
+    }
+
+
+@functools.lru_cache(maxsize=None)
+def _sdist_response(name, *releases):
+    """A response listing one source tarball per (version, sha256) pair in
+    `releases`, the first of which is the latest. The same arguments always
+    give back the same instance."""
+    return _Response(
+        {
+            "info": {"version": releases[0][0], "name": name},
+            "releases": {
+                version: [
+                    {
+                        "url": f"https://pypi.org/packages/source/p/{name}/{name}-{version}.tar.gz",
+                        "digests": {"sha256": sha256},
+                    }
+                ]
+                for version, sha256 in releases
+            },
+        }
+    )
+
+
+# PyPI JSON responses that several tests register. `_Response` serializes
+# its payload to bytes the first time it's read and only ever hands those
+# back afterwards, so the instances are safe to share.
+_HASHIN_010_RESPONSE = _Response(_hashin_010_payload("https://pypi.org/"))
+
+# What's in the files that `_HASHIN_010_RESPONSE` lists.
+_HASHIN_010_FILES = {
+    "https://pypi.org/packages/2.7/p/hashin/hashin-0.10-py2-none-any.whl": (
+        b"Some py2 wheel content\n"
+    ),
+    "https://pypi.org/packages/3.3/p/hashin/hashin-0.10-py3-none-any.whl": (
+        b"Some py3 wheel content\n"
+    ),
+    "https://pypi.org/packages/source/p/hashin/hashin-0.10.tar.gz": (
+        b"Some tarball content\n"
+    ),
+}
+
+
+def _hashin_010_files():
+    """Responses for all of `_HASHIN_010_FILES`, to add to `pypi_mock`.
+    These are new every time because they keep track of how much of them
+    has been read."""
+    return {url: _Response(content) for url, content in _HASHIN_010_FILES.items()}
+
+
+_REQUESTS_124_RESPONSE = _sdist_response("requests", ("1.2.4", "dededede"))
+
+_HASHIN_011_RESPONSE = _sdist_response("hashin", ("0.11", "bbbbb"), ("0.10", "aaaaa"))
+
+
+@pytest.fixture(scope="session")
+def enum34_response():
+    """The enum34 1.1.6 release as PyPI's JSON API lists it. It's only read
+    from disk once, and served as is."""
+    filename = os.path.join(os.path.dirname(__file__), "data", "enum34.json")
+    with open(filename, "rb") as f:
+        return _Response(f.read())
+
+
+def test_get_latest_version_simple():
     version = hashin.get_latest_version({"info": {"version": "0.3"}}, False)
     assert version == "0.3"
 
-    @mock.patch("hashin.urlopen")
-    def test_get_latest_version_non_pre_release(self, murlopen):
-        version = hashin.get_latest_version(
-            {
-                "info": {"version": "0.3"},
-                "releases": {
-                    "0.99": {},
-                    "0.999": {},
-                    "1.1.0rc1": {},
-                    "1.1rc1": {},
-                    "1.0a1": {},
-                    "2.0b2": {},
-                    "2.0c3": {},
-                },
+
+def test_get_latest_version_non_pre_release():
+    version = hashin.get_latest_version(
+        {
+            "info": {"version": "0.3"},
+            "releases": {
+                "0.99": {},
+                "0.999": {},
+                "1.1.0rc1": {},
+                "1.1rc1": {},
+                "1.0a1": {},
+                "2.0b2": {},
+                "2.0c3": {},
             },
-            False,
-        )
-        assert version == "0.999"
+        },
+        False,
+    )
+    assert version == "0.999"
 
 
-def test_get_latest_version_only_pre_release(murlopen):
-    with pytest.raises(hashin.NoVersionsError) as exc_info:
+def test_get_latest_version_only_pre_release():
+    message = (
+        "No valid version found. But, found 5 pre-releases. "
+        "Consider running again with the --include-prereleases flag."
+    )
+    with pytest.raises(hashin.NoVersionsError, match=f"^{re.escape(message)}$"):
         hashin.get_latest_version(
             {
                 "info": {"version": "0.3"},
@@ -69,10 +171,6 @@ def test_get_latest_version_only_pre_release(murlopen):
             },
             False,
         )
-    assert str(exc_info.value) == (
-        "No valid version found. But, found 5 pre-releases. "
-        "Consider running again with the --include-prereleases flag."
-    )
 
     version = hashin.get_latest_version(
         {
@@ -90,7 +188,7 @@ def test_get_latest_version_only_pre_release(murlopen):
     assert version == "2.0c3"
 
 
-def test_get_latest_version_non_pre_release_leading_zeros(murlopen):
+def test_get_latest_version_non_pre_release_leading_zeros():
     version = hashin.get_latest_version(
         {
             "info": {"version": "0.3"},
@@ -101,47 +199,48 @@ def test_get_latest_version_non_pre_release_leading_zeros(murlopen):
     assert version == "0.04.21"
 
 
-def test_get_hashes_error(murlopen):
-    def mocked_get(url, **options):
-        if url == "https://pypi.org/pypi/somepackage/json":
-            return _Response({})
-        raise NotImplementedError(url)
-
-    murlopen.side_effect = mocked_get
+def test_get_hashes_error(pypi_mock):
+    pypi_mock["https://pypi.org/pypi/somepackage/json"] = _Response({})
     with pytest.raises(hashin.PackageError):
         hashin.run("somepackage==1.2.3", "doesntmatter.txt", "sha256")
 
 
-def test_non_200_ok_download(murlopen):
-    def mocked_get(url, **options):
-        return _Response({}, status_code=403)
-
-    murlopen.side_effect = mocked_get
+def test_non_200_ok_download(pypi_mock):
+    pypi_mock.register_prefix(
+        "https://pypi.org/", lambda url: _Response({}, status_code=403)
+    )
 
     with pytest.raises(hashin.PackageError):
         hashin.run("somepackage==1.2.3", "doesntmatter.txt", "sha256")
 
 
+# What `get_parser().parse_args()` gives back when nothing but a package is
+# passed.
+_MAIN_ARGS = dict(
+    packages=["something"],
+    requirements_file="requirements.txt",
+    algorithm="sha256",
+    python_version="3.8",
+    verbose=False,
+    include_prereleases=False,
+    dry_run=False,
+    update_all=False,
+    interactive=False,
+    synchronous=False,
+    index_url=None,
+)
+
+
+def _main_args(**overrides):
+    # A new namespace every time, because `main()` changes the one it gets.
+    return argparse.Namespace(**dict(_MAIN_ARGS, **overrides))
+
+
 def test_main_packageerrors_stderr(mock_run, capsys, mock_get_parser):
     # Doesn't matter so much what, just make sure it breaks
     mock_run.side_effect = hashin.PackageError("Some message here")
 
-    def mock_parse_args(*a, **k):
-        return argparse.Namespace(
-            packages=["something"],
-            requirements_file="requirements.txt",
-            algorithm="sha256",
-            python_version="3.8",
-            verbose=False,
-            include_prereleases=False,
-            dry_run=False,
-            update_all=False,
-            interactive=False,
-            synchronous=False,
-            index_url=None,
-        )
-
-    mock_get_parser().parse_args.side_effect = mock_parse_args
+    mock_get_parser().parse_args.return_value = _main_args()
 
     error = hashin.main()
     assert error == 1
@@ -150,21 +249,9 @@ def test_main_packageerrors_stderr(mock_run, capsys, mock_get_parser):
 
 
 def test_packages_and_update_all(capsys, mock_get_parser):
-    def mock_parse_args(*a, **k):
-        return argparse.Namespace(
-            packages=["something"],
-            requirements_file="requirements.txt",
-            algorithm="sha256",
-            python_version="3.8",
-            verbose=False,
-            include_prereleases=False,
-            dry_run=False,
-            update_all=True,  # Note!
-            interactive=False,
-            synchronous=False,
-        )
-
-    mock_get_parser().parse_args.side_effect = mock_parse_args
+    mock_get_parser().parse_args.return_value = _main_args(
+        update_all=True,  # Note!
+    )
 
     error = hashin.main()
     assert error == 2
@@ -174,52 +261,27 @@ def test_packages_and_update_all(capsys, mock_get_parser):
     )
 
 
-def test_packages_and_update_all_with_requirements_file(
-    capsys, mock_get_parser, tmpfile
-):
-    with tmpfile() as filename:
-        with open(filename, "w") as f:
-            f.write("")
-
-        def mock_parse_args(*a, **k):
-            return argparse.Namespace(
-                packages=[filename],  # Note!
-                algorithm="sha256",
-                python_version="3.8",
-                verbose=False,
-                include_prereleases=False,
-                dry_run=False,
-                update_all=True,
-                interactive=False,
-                synchronous=False,
-                index_url="anything",
-            )
-
-        mock_get_parser().parse_args.side_effect = mock_parse_args
-
-        error = hashin.main()
-        assert error == 0
-        # Because the requirements file is empty, the update-all command
-        # won't find anything to query the internet about so we don't
-        # need to mock murlopen in this test.
+def test_packages_and_update_all_with_requirements_file(mock_get_parser, tmp_path):
+    filename = tmp_path / "requirements.txt"
+    filename.touch()
 
+    mock_get_parser().parse_args.return_value = _main_args(
+        packages=[str(filename)],  # Note!
+        update_all=True,
+        index_url="anything",
+    )
 
-def test_no_packages_and_not_update_all(capsys, mock_get_parser):
-    def mock_parse_args(*a, **k):
-        return argparse.Namespace(
-            packages=[],  # Note!
-            requirements_file="requirements.txt",
-            algorithm="sha256",
-            python_version="3.8",
-            verbose=False,
-            include_prereleases=False,
-            dry_run=False,
-            update_all=False,
-            interactive=False,
-            synchronous=False,
-        )
+    error = hashin.main()
+    assert error == 0
+    # Because the requirements file is empty, the update-all command
+    # won't find anything to query the internet about so we don't
+    # need to mock urlopen in this test.
 
-    mock_get_parser().parse_args.side_effect = mock_parse_args
+
+def test_no_packages_and_not_update_all(capsys, mock_get_parser):
+    mock_get_parser().parse_args.return_value = _main_args(
+        packages=[],  # Note!
+    )
 
     error = hashin.main()
     assert error == 3
@@ -228,21 +290,10 @@ def test_no_packages_and_not_update_all(capsys, mock_get_parser):
 
 
 def test_interactive_not_update_all(mock_get_parser, capsys):
-    def mock_parse_args(*a, **k):
-        return argparse.Namespace(
-            packages=[],
-            requirements_file="requirements.txt",
-            algorithm="sha256",
-            python_version="3.8",
-            verbose=False,
-            include_prereleases=False,
-            dry_run=False,
-            update_all=False,  # Note!
-            interactive=True,  # Note!
-            synchronous=False,
-        )
-
-    mock_get_parser().parse_args.side_effect = mock_parse_args
+    mock_get_parser().parse_args.return_value = _main_args(
+        packages=[],
+        interactive=True,  # Note!
+    )
 
     error = hashin.main()
     assert error == 4
@@ -259,73 +310,129 @@ def test_main_version(mock_sys, capsys):
     assert error == 0
     captured = capsys.readouterr()
     version = captured.out.strip()
-    from importlib import metadata
-
-    current_version = metadata.version("hashin")
     # No easy way to know what exact version it is
-    assert version == current_version
-
-
-def test_amend_requirements_content_new():
-    requirements = (
-        """
-# empty so far
-    """.strip()
-        + "\n"
-    )
-    new_lines = (
-        "autocompeter",
-        "autocompeter",
-        """
-autocompeter==1.2.3 \\
-    --hash=sha256:4d64ed1b9e0e73095f5cfa87f0e97ddb4c840049e8efeb7e63b46118ba1d623a
-    """.strip()
-        + "\n",
-    )
-    result = hashin.amend_requirements_content(requirements, [new_lines])
-    assert result == requirements + new_lines[2]
-
-
-def test_amend_requirements_content_new_2():
-    requirements = (
-        """
-# empty so far
-    """.strip()
-        + "\n"
-    )
-    new_lines = (
-        "discogs-client",
-        "Discogs_client",
-        """
-discogs-client==1.1 \\
-    --hash=sha256:4d64ed1b9e0e73095f5cfa87f0e97ddb4c840049e8efeb7e63b46118ba1d623a
-    """.strip()
-        + "\n",
-    )
-    result = hashin.amend_requirements_content(requirements, [new_lines])
-    assert result == requirements + new_lines[2]
-
-
-def test_amend_requirements_different_old_name():
-    requirements = (
-        """
-Discogs_client==1.0 \\
-    --hash=sha256:a326d1ab81164b36e7befe8e940048c4bdd79e0f78afc5f59037e0e9b1de46d4
-
-    """.strip()
-        + "\n"
-    )
-    new_lines = (
-        "discogs-client",
-        "Discogs_client",
-        """
-discogs-client==1.1 \\
-    --hash=sha256:4d64ed1b9e0e73095f5cfa87f0e97ddb4c840049e8efeb7e63b46118ba1d623a
-    """.strip()
-        + "\n",
-    )
+    assert version == metadata.version("hashin")
+
+
+@pytest.mark.parametrize(
+    "requirements, new_lines, expected",
+    [
+        pytest.param(
+            "# empty so far\n",
+            (
+                "autocompeter",
+                "autocompeter",
+                "autocompeter==1.2.3 \\\n"
+                "    --hash=sha256:4d64ed1b9e0e73095f5cfa87f0e97ddb4c840049e8efeb7e63b46118ba1d623a\n",
+            ),
+            "# empty so far\n"
+            "autocompeter==1.2.3 \\\n"
+            "    --hash=sha256:4d64ed1b9e0e73095f5cfa87f0e97ddb4c840049e8efeb7e63b46118ba1d623a\n",
+            id="new",
+        ),
+        pytest.param(
+            "# empty so far\n",
+            (
+                "discogs-client",
+                "Discogs_client",
+                "discogs-client==1.1 \\\n"
+                "    --hash=sha256:4d64ed1b9e0e73095f5cfa87f0e97ddb4c840049e8efeb7e63b46118ba1d623a\n",
+            ),
+            "# empty so far\n"
+            "discogs-client==1.1 \\\n"
+            "    --hash=sha256:4d64ed1b9e0e73095f5cfa87f0e97ddb4c840049e8efeb7e63b46118ba1d623a\n",
+            id="new_different_name",
+        ),
+        pytest.param(
+            "Discogs_client==1.0 \\\n"
+            "    --hash=sha256:a326d1ab81164b36e7befe8e940048c4bdd79e0f78afc5f59037e0e9b1de46d4\n",
+            (
+                "discogs-client",
+                "Discogs_client",
+                "discogs-client==1.1 \\\n"
+                "    --hash=sha256:4d64ed1b9e0e73095f5cfa87f0e97ddb4c840049e8efeb7e63b46118ba1d623a\n",
+            ),
+            "discogs-client==1.1 \\\n"
+            "    --hash=sha256:4d64ed1b9e0e73095f5cfa87f0e97ddb4c840049e8efeb7e63b46118ba1d623a\n",
+            id="different_old_name",
+        ),
+        pytest.param(
+            "autocompeter==1.2.2\n"
+            "    --hash=sha256:33a5d0145e82326e781ddee1ad375f92cb84f8cfafea56e9504682adff64a5ee\n",
+            (
+                "autocompeter",
+                "autocompeter",
+                "autocompeter==1.2.3\n"
+                "    --hash=sha256:4d64ed1b9e0e73095f5cfa87f0e97ddb4c840049e8efeb7e63b46118ba1d623a\n",
+            ),
+            "autocompeter==1.2.3\n"
+            "    --hash=sha256:4d64ed1b9e0e73095f5cfa87f0e97ddb4c840049e8efeb7e63b46118ba1d623a\n",
+            id="replacement",
+        ),
+        pytest.param(
+            # Unchanged, because only the order of the --hash lines changed.
+            "autocompeter==1.2.2\n"
+            "    --hash=sha256:33a5d0145e82326e781ddee1ad375f92cb84f8cfafea56e9504682adff64a5ee\n"
+            "    --hash=sha256:4d64ed1b9e0e73095f5cfa87f0e97ddb4c840049e8efeb7e63b46118ba1d623a\n",
+            (
+                "autocompeter",
+                "autocompeter",
+                "autocompeter==1.2.2\n"
+                "    --hash=sha256:4d64ed1b9e0e73095f5cfa87f0e97ddb4c840049e8efeb7e63b46118ba1d623a\n"
+                "    --hash=sha256:33a5d0145e82326e781ddee1ad375f92cb84f8cfafea56e9504682adff64a5ee\n",
+            ),
+            "autocompeter==1.2.2\n"
+            "    --hash=sha256:33a5d0145e82326e781ddee1ad375f92cb84f8cfafea56e9504682adff64a5ee\n"
+            "    --hash=sha256:4d64ed1b9e0e73095f5cfa87f0e97ddb4c840049e8efeb7e63b46118ba1d623a\n",
+            id="actually_not_replacement",
+        ),
+        pytest.param(
+            "autocompeter==1.2.2\n"
+            "    --hash=sha256:33a5d0145e82326e781ddee1ad375f92cb84f8cfafea56e9504682adff64a5ee\n",
+            (
+                "autocompeter",
+                "autocompeter",
+                "autocompeter==1.2.2\n"
+                "    --hash=sha256:4d64ed1b9e0e73095f5cfa87f0e97ddb4c840049e8efeb7e63b46118ba1d623a\n"
+                "    --hash=sha256:33a5d0145e82326e781ddee1ad375f92cb84f8cfafea56e9504682adff64a5ee\n",
+            ),
+            "autocompeter==1.2.2\n"
+            "    --hash=sha256:4d64ed1b9e0e73095f5cfa87f0e97ddb4c840049e8efeb7e63b46118ba1d623a\n"
+            "    --hash=sha256:33a5d0145e82326e781ddee1ad375f92cb84f8cfafea56e9504682adff64a5ee\n",
+            id="replacement_addition",
+        ),
+        pytest.param(
+            # Previously written as a single line, now ends up as multiple lines.
+            "autocompeter==1.2.2 --hash=sha256:33a5d0145e82326e781ddee1ad375f92cb84f8cfafea56e9504682adff64a5ee\n",
+            (
+                "autocompeter",
+                "autocompeter",
+                "autocompeter==1.2.3\n"
+                "    --hash=sha256:4d64ed1b9e0e73095f5cfa87f0e97ddb4c840049e8efeb7e63b46118ba1d623a\n",
+            ),
+            "autocompeter==1.2.3\n"
+            "    --hash=sha256:4d64ed1b9e0e73095f5cfa87f0e97ddb4c840049e8efeb7e63b46118ba1d623a\n",
+            id="replacement_single_to_multi",
+        ),
+        pytest.param(
+            "autocompeter==1.2.2 \\\n"
+            "    --hash=sha256:01047449bc6e46792217fe62deba683979a60b33de7efd99ed564cf43907021b \\\n"
+            "    --hash=sha256:33a5d0145e82326e781ddee1ad375f92cb84f8cfafea56e9504682adff64a5ee\n",
+            (
+                "autocompeter",
+                "autocompeter",
+                "autocompeter==1.2.3 \\\n"
+                "    --hash=sha256:4d64ed1b9e0e73095f5cfa87f0e97ddb4c840049e8efeb7e63b46118ba1d623a\n",
+            ),
+            "autocompeter==1.2.3 \\\n"
+            "    --hash=sha256:4d64ed1b9e0e73095f5cfa87f0e97ddb4c840049e8efeb7e63b46118ba1d623a\n",
+            id="replacement_2",
+        ),
+    ],
+)
+def test_amend_requirements_content(requirements, new_lines, expected):
     result = hashin.amend_requirements_content(requirements, [new_lines])
-    assert result == new_lines[2]
+    assert result == expected
 
 
 def test_amend_requirements_content_multiple_merge():
@@ -384,28 +491,42 @@ examplepackage==10.0.0 \\
     assert result == expect
 
 
-def test_amend_requirements_content_replacement():
-    requirements = (
-        """
-autocompeter==1.2.2
-    --hash=sha256:33a5d0145e82326e781ddee1ad375f92cb84f8cfafea56e9504682adff64a5ee
-    """.strip()
-        + "\n"
-    )
-
-    new_lines = (
-        "autocompeter",
-        "autocompeter",
-        """
-autocompeter==1.2.3
-    --hash=sha256:4d64ed1b9e0e73095f5cfa87f0e97ddb4c840049e8efeb7e63b46118ba1d623a
-    """.strip()
-        + "\n",
+def test_amend_requirements_content_multiple_new():
+    requirements = "\n# empty so far\n\n"
+    all_new_lines = [
+        (
+            "autocompeter",
+            "autocompeter",
+            "autocompeter==1.2.3 \\\n    --hash=sha256:aaa\n",
+        ),
+        (
+            "examplepackage",
+            "examplepackage",
+            "examplepackage==9.8.6 \\\n    --hash=sha256:bbb\n",
+        ),
+        # Replaces what was only just added to the bottom.
+        (
+            "autocompeter",
+            "autocompeter",
+            "autocompeter==1.3.0 \\\n    --hash=sha256:ccc\n",
+        ),
+        (
+            "otherpackage",
+            "otherpackage",
+            "otherpackage==1.0.0 \\\n    --hash=sha256:ddd\n",
+        ),
+    ]
+    result = hashin.amend_requirements_content(requirements, all_new_lines)
+    assert result == (
+        "# empty so far\n"
+        "autocompeter==1.3.0 \\\n"
+        "    --hash=sha256:ccc\n"
+        "examplepackage==9.8.6 \\\n"
+        "    --hash=sha256:bbb\n"
+        "otherpackage==1.0.0 \\\n"
+        "    --hash=sha256:ddd\n"
     )
 
-    result = hashin.amend_requirements_content(requirements, [new_lines])
-    assert result == new_lines[2]
-
 
 def test_amend_requirements_content_replacement_keep_indented_comments():
     requirements = (
@@ -451,102 +572,6 @@ examplepackage==10.0.0 \\
     assert result == expect
 
 
-def test_amend_requirements_content_actually_not_replacement():
-    requirements = (
-        """
-autocompeter==1.2.2
-    --hash=sha256:33a5d0145e82326e781ddee1ad375f92cb84f8cfafea56e9504682adff64a5ee
-    --hash=sha256:4d64ed1b9e0e73095f5cfa87f0e97ddb4c840049e8efeb7e63b46118ba1d623a
-    """.strip()
-        + "\n"
-    )
-
-    new_lines = (
-        "autocompeter",
-        "autocompeter",
-        """
-autocompeter==1.2.2
-    --hash=sha256:4d64ed1b9e0e73095f5cfa87f0e97ddb4c840049e8efeb7e63b46118ba1d623a
-    --hash=sha256:33a5d0145e82326e781ddee1ad375f92cb84f8cfafea56e9504682adff64a5ee
-    """.strip()
-        + "\n",
-    )
-
-    result = hashin.amend_requirements_content(requirements, [new_lines])
-    # It should be unchanged because the only thing that changed was the
-    # order of the --hash lines.
-    assert result == requirements
-
-
-def test_amend_requirements_content_replacement_addition():
-    requirements = (
-        """
-autocompeter==1.2.2
-    --hash=sha256:33a5d0145e82326e781ddee1ad375f92cb84f8cfafea56e9504682adff64a5ee
-    """.strip()
-        + "\n"
-    )
-
-    new_lines = (
-        "autocompeter",
-        "autocompeter",
-        """
-autocompeter==1.2.2
-    --hash=sha256:4d64ed1b9e0e73095f5cfa87f0e97ddb4c840049e8efeb7e63b46118ba1d623a
-    --hash=sha256:33a5d0145e82326e781ddee1ad375f92cb84f8cfafea56e9504682adff64a5ee
-    """.strip()
-        + "\n",
-    )
-
-    result = hashin.amend_requirements_content(requirements, [new_lines])
-    assert result == new_lines[2]
-
-
-def test_amend_requirements_content_replacement_single_to_multi():
-    """Change from autocompeter==1.2.2 to autocompeter==1.2.3
-    when it was previously written as a single line and now
-    ends up as a multi-line."""
-    requirements = (
-        """
-autocompeter==1.2.2 --hash=sha256:33a5d0145e82326e781ddee1ad375f92cb84f8cfafea56e9504682adff64a5ee
-    """.strip()
-        + "\n"
-    )
-    new_lines = (
-        "autocompeter",
-        "autocompeter",
-        """
-autocompeter==1.2.3
-    --hash=sha256:4d64ed1b9e0e73095f5cfa87f0e97ddb4c840049e8efeb7e63b46118ba1d623a
-    """.strip()
-        + "\n",
-    )
-    result = hashin.amend_requirements_content(requirements, [new_lines])
-    assert result == new_lines[2]
-
-
-def test_amend_requirements_content_replacement_2():
-    requirements = (
-        """
-autocompeter==1.2.2 \\
-    --hash=sha256:01047449bc6e46792217fe62deba683979a60b33de7efd99ed564cf43907021b \\
-    --hash=sha256:33a5d0145e82326e781ddee1ad375f92cb84f8cfafea56e9504682adff64a5ee
-    """.strip()
-        + "\n"
-    )
-    new_lines = (
-        "autocompeter",
-        "autocompeter",
-        """
-autocompeter==1.2.3 \\
-    --hash=sha256:4d64ed1b9e0e73095f5cfa87f0e97ddb4c840049e8efeb7e63b46118ba1d623a
-    """.strip()
-        + "\n",
-    )
-    result = hashin.amend_requirements_content(requirements, [new_lines])
-    assert result == new_lines[2]
-
-
 def test_amend_requirements_content_replacement_amongst_others():
     previous = (
         """
@@ -675,772 +700,428 @@ botocore==1.12.221 \\
     assert result == expect
 
 
-def test_run(murlopen, tmpfile, capsys):
-    def mocked_get(url, **options):
-        if url == "https://pypi.org/pypi/hashin/json":
-            return _Response(
-                {
-                    "info": {"version": "0.10", "name": "hashin"},
-                    "releases": {
-                        "0.10": [
-                            {
-                                "url": "https://pypi.org/packages/2.7/p/hashin/hashin-0.10-py2-none-any.whl",
-                                "digests": {"sha256": "aaaaa"},
-                            },
-                            {
-                                "url": "https://pypi.org/packages/3.3/p/hashin/hashin-0.10-py3-none-any.whl",
-                                "digests": {"sha256": "bbbbb"},
-                            },
-                            {
-                                "url": "https://pypi.org/packages/source/p/hashin/hashin-0.10.tar.gz",
-                                "digests": {"sha256": "ccccc"},
-                            },
-                        ]
-                    },
-                }
-            )
-        elif (
-            url == "https://pypi.org/packages/2.7/p/hashin/hashin-0.10-py2-none-any.whl"
-        ):
-            return _Response(b"Some py2 wheel content\n")
-        elif (
-            url == "https://pypi.org/packages/3.3/p/hashin/hashin-0.10-py3-none-any.whl"
-        ):
-            return _Response(b"Some py3 wheel content\n")
-        elif url == "https://pypi.org/packages/source/p/hashin/hashin-0.10.tar.gz":
-            return _Response(b"Some tarball content\n")
-
-        raise NotImplementedError(url)
-
-    murlopen.side_effect = mocked_get
+def test_run(pypi_mock, requirements_file, capsys):
+    pypi_mock["https://pypi.org/pypi/hashin/json"] = _HASHIN_010_RESPONSE
+    pypi_mock.update(_hashin_010_files())
 
-    with tmpfile() as filename:
-        with open(filename, "w") as f:
-            f.write("")
+    retcode = hashin.run("hashin==0.10", requirements_file, "sha256", verbose=True)
 
-        retcode = hashin.run("hashin==0.10", filename, "sha256", verbose=True)
-
-        assert retcode == 0
-        with open(filename) as f:
-            output = f.read()
-        assert output
-        assert output.endswith("\n")
-        lines = output.splitlines()
-
-        assert lines[0] == "hashin==0.10 \\"
-        assert lines[1] == "    --hash=sha256:aaaaa \\"
-        assert lines[2] == "    --hash=sha256:bbbbb \\"
-        assert lines[3] == "    --hash=sha256:ccccc"
-
-        # Now check the verbose output
-        captured = capsys.readouterr()
-        out_lines = captured.out.splitlines()
-        assert "https://pypi.org/pypi/hashin/json" in out_lines[0], out_lines[0]
-        # url to download
-        assert "hashin-0.10-py2-none-any.whl" in out_lines[1], out_lines[1]
-
-        assert (
-            "Found hash for https://pypi.org/packages/2.7/p/hashin/hashin-0.10-py2-none-any.whl"
-            in out_lines[1]
-        ), out_lines[1]
-
-        # hash it got
-        assert "aaaaa" in out_lines[2], out_lines[2]
-
-        # Change algorithm
-        retcode = hashin.run("hashin==0.10", filename, "sha512")
-        assert retcode == 0
-        with open(filename) as f:
-            output = f.read()
-        assert output.endswith("\n")
-        lines = output.splitlines()
-        assert lines[0] == "hashin==0.10 \\"
-        assert (
-            "    --hash=sha512:0d63bf4c115154781846ecf573049324f06b021a1"
-            "d4b92da4fae2bf491da2b83a13096b14d73e73cefad36855f4fa936bac4"
-            "b2357dabf05a2b1e7329ff1e5455 \\"
-        ) in lines
-        assert (
-            "    --hash=sha512:45d1c5d2237a3b4f78b4198709fb2ecf1f781c823"
-            "4ce3d94356f2100a36739433952c6c13b2843952f608949e6baa9f95055"
-            "a314487cd8fb3f9d76522d8edb50 \\"
-        ) in lines
-        assert (
-            "    --hash=sha512:c32e6d9fb09dc36ab9222c4606a1f43a2dcc183a8"
-            "c64bdd9199421ef779072c174fa044b155babb12860cf000e36bc4d3586"
-            "94fa22420c997b1dd75b623d4daa"
-        ) in lines
-
-
-def test_canonical_list_of_hashes(murlopen, tmpfile, capsys):
-    """When hashes are written down, after the package spec, write down the hashes
-    in a canonical way. Essentially, in lexicographic order. But when comparing
-    existing hashes ignore any order.
-    """
-
-    def mocked_get(url, **options):
-        if url == "https://pypi.org/pypi/hashin/json":
-            return _Response(
-                {
-                    "info": {"version": "0.10", "name": "hashin"},
-                    "releases": {
-                        # NOTE that the order of list is different from
-                        # the order you'd get of `sorted(x.digest for x in releases)`
-                        "0.10": [
-                            {
-                                "url": "https://pypi.org/packages/source/p/hashin/hashin-0.10.tar.gz",
-                                "digests": {"sha256": "ccccc"},
-                            },
-                            {
-                                "url": "https://pypi.org/packages/2.7/p/hashin/hashin-0.10-py2-none-any.whl",
-                                "digests": {"sha256": "aaaaa"},
-                            },
-                            {
-                                "url": "https://pypi.org/packages/3.3/p/hashin/hashin-0.10-py3-none-any.whl",
-                                "digests": {"sha256": "bbbbb"},
-                            },
-                        ]
-                    },
-                }
-            )
-        raise NotImplementedError(url)
+    assert retcode == 0
+    output = requirements_file.getvalue()
+    assert output
+    assert output.endswith("\n")
+    lines = output.splitlines()
 
-    murlopen.side_effect = mocked_get
+    assert lines[0] == "hashin==0.10 \\"
+    assert lines[1] == "    --hash=sha256:aaaaa \\"
+    assert lines[2] == "    --hash=sha256:bbbbb \\"
+    assert lines[3] == "    --hash=sha256:ccccc"
 
-    with tmpfile() as filename:
-        with open(filename, "w") as f:
-            f.write("")
-
-        retcode = hashin.run("hashin==0.10", filename, "sha256")
-
-        assert retcode == 0
-        with open(filename) as f:
-            output = f.read()
-        assert output
-        assert output.endswith("\n")
-        lines = output.splitlines()
-
-        assert lines[0] == "hashin==0.10 \\"
-        assert lines[1] == "    --hash=sha256:aaaaa \\"
-        assert lines[2] == "    --hash=sha256:bbbbb \\"
-        assert lines[3] == "    --hash=sha256:ccccc"
+    # Now check the verbose output
+    captured = capsys.readouterr()
+    out_lines = captured.out.splitlines()
+    assert "https://pypi.org/pypi/hashin/json" in out_lines[0], out_lines[0]
+    # url to download
+    assert "hashin-0.10-py2-none-any.whl" in out_lines[1], out_lines[1]
 
+    assert (
+        "Found hash for https://pypi.org/packages/2.7/p/hashin/hashin-0.10-py2-none-any.whl"
+        in out_lines[1]
+    ), out_lines[1]
+
+    # hash it got
+    assert "aaaaa" in out_lines[2], out_lines[2]
+
+    # Change algorithm
+    retcode = hashin.run("hashin==0.10", requirements_file, "sha512")
+    assert retcode == 0
+    output = requirements_file.getvalue()
+    assert output.endswith("\n")
+    lines = output.splitlines()
+    assert lines[0] == "hashin==0.10 \\"
+    assert (
+        "    --hash=sha512:0d63bf4c115154781846ecf573049324f06b021a1"
+        "d4b92da4fae2bf491da2b83a13096b14d73e73cefad36855f4fa936bac4"
+        "b2357dabf05a2b1e7329ff1e5455 \\"
+    ) in lines
+    assert (
+        "    --hash=sha512:45d1c5d2237a3b4f78b4198709fb2ecf1f781c823"
+        "4ce3d94356f2100a36739433952c6c13b2843952f608949e6baa9f95055"
+        "a314487cd8fb3f9d76522d8edb50 \\"
+    ) in lines
+    assert (
+        "    --hash=sha512:c32e6d9fb09dc36ab9222c4606a1f43a2dcc183a8"
+        "c64bdd9199421ef779072c174fa044b155babb12860cf000e36bc4d3586"
+        "94fa22420c997b1dd75b623d4daa"
+    ) in lines
 
-def test_run_atomic_not_write_with_error_on_last_package(murlopen, tmpfile):
-    def mocked_get(url, **options):
 
-        if url == "https://pypi.org/pypi/hashin/json":
-            return _Response(
-                {
-                    "info": {"version": "0.10", "name": "hashin"},
-                    "releases": {
-                        "0.10": [
-                            {
-                                "url": "https://pypi.org/packages/2.7/p/hashin/hashin-0.10-py2-none-any.whl",
-                                "digests": {"sha256": "aaaaa"},
-                            },
-                            {
-                                "url": "https://pypi.org/packages/3.3/p/hashin/hashin-0.10-py3-none-any.whl",
-                                "digests": {"sha256": "bbbbb"},
-                            },
-                            {
-                                "url": "https://pypi.org/packages/source/p/hashin/hashin-0.10.tar.gz",
-                                "digests": {"sha256": "ccccc"},
-                            },
-                        ]
+def test_run_multiple_algorithms(pypi_mock, requirements_file):
+    pypi_mock["https://pypi.org/pypi/hashin/json"] = _Response(
+        {
+            "info": {"version": "0.10", "name": "hashin"},
+            "releases": {
+                "0.10": [
+                    {
+                        "url": "https://pypi.org/packages/2.7/p/hashin/hashin-0.10-py2-none-any.whl",
+                        "digests": {"sha256": "aaaaa"},
+                    },
+                    {
+                        "url": "https://pypi.org/packages/source/p/hashin/hashin-0.10.tar.gz",
+                        "digests": {"sha256": "ccccc"},
                     },
-                }
-            )
+                ]
+            },
+        }
+    )
+    pypi_mock.update(_hashin_010_files())
+
+    retcode = hashin.run("hashin==0.10", requirements_file, "sha256,sha512")
+
+    assert retcode == 0
+    output = requirements_file.getvalue()
+    lines = output.splitlines()
+    assert lines == [
+        "hashin==0.10 \\",
+        "    --hash=sha256:aaaaa \\",
+        "    --hash=sha256:ccccc \\",
+        "    --hash=sha512:45d1c5d2237a3b4f78b4198709fb2ecf1f781c823"
+        "4ce3d94356f2100a36739433952c6c13b2843952f608949e6baa9f95055"
+        "a314487cd8fb3f9d76522d8edb50 \\",
+        "    --hash=sha512:c32e6d9fb09dc36ab9222c4606a1f43a2dcc183a8"
+        "c64bdd9199421ef779072c174fa044b155babb12860cf000e36bc4d3586"
+        "94fa22420c997b1dd75b623d4daa",
+    ]
 
-        if url == "https://pypi.org/pypi/gobblygook/json":
-            if HTTPError:
-                raise HTTPError(url, 404, "Page not found", {}, None)
-            else:
-                return _Response({}, status_code=404)
 
-        raise NotImplementedError(url)
+def test_run_algorithm_normalized(pypi_mock, requirements_file):
+    pypi_mock["https://pypi.org/pypi/hashin/json"] = _HASHIN_010_RESPONSE
 
-    murlopen.side_effect = mocked_get
+    retcode = hashin.run("hashin==0.10", requirements_file, " sha256,")
 
-    with tmpfile() as filename:
-        with open(filename, "w") as f:
-            f.write("")
+    assert retcode == 0
+    assert requirements_file.getvalue().splitlines() == [
+        "hashin==0.10 \\",
+        "    --hash=sha256:aaaaa \\",
+        "    --hash=sha256:bbbbb \\",
+        "    --hash=sha256:ccccc",
+    ]
 
-        with pytest.raises(hashin.PackageNotFoundError):
-            hashin.run(["hashin", "gobblygook"], filename, "sha256", verbose=True)
 
-        with open(filename) as f:
-            output = f.read()
-            # Crucial that nothing was written to the file.
-            # The first package would find some new requirements but the second
-            # package should cancel the write.
-            assert output == ""
+@pytest.mark.parametrize(
+    "algorithm", [",", " ", "", "md5", "sha256,sha512,sha256", ["sha256", "sha256"]]
+)
+def test_run_bad_algorithm(algorithm):
+    # Nothing is looked up, and nothing is written without any hashes.
+    with pytest.raises(hashin.PackageError):
+        hashin.run("hashin==0.10", "doesntmatter.txt", algorithm)
 
 
-def test_run_interactive(murlopen, tmpfile, capsys):
-    def mocked_get(url, **options):
+def test_canonical_list_of_hashes(pypi_mock, requirements_file):
+    """When hashes are written down, after the package spec, write down the hashes
+    in a canonical way. Essentially, in lexicographic order. But when comparing
+    existing hashes ignore any order.
+    """
 
-        if url == "https://pypi.org/pypi/hashin/json":
-            return _Response(
-                {
-                    "info": {"version": "0.10", "name": "hashin"},
-                    "releases": {
-                        "0.10": [
-                            {
-                                "url": "https://pypi.org/packages/2.7/p/hashin/hashin-0.10-py2-none-any.whl",
-                                "digests": {"sha256": "aaaaa"},
-                            },
-                            {
-                                "url": "https://pypi.org/packages/3.3/p/hashin/hashin-0.10-py3-none-any.whl",
-                                "digests": {"sha256": "bbbbb"},
-                            },
-                            {
-                                "url": "https://pypi.org/packages/source/p/hashin/hashin-0.10.tar.gz",
-                                "digests": {"sha256": "ccccc"},
-                            },
-                        ]
+    pypi_mock["https://pypi.org/pypi/hashin/json"] = _Response(
+        {
+            "info": {"version": "0.10", "name": "hashin"},
+            "releases": {
+                # NOTE that the order of list is different from
+                # the order you'd get of `sorted(x.digest for x in releases)`
+                "0.10": [
+                    {
+                        "url": "https://pypi.org/packages/source/p/hashin/hashin-0.10.tar.gz",
+                        "digests": {"sha256": "ccccc"},
                     },
-                }
-            )
-        elif url == "https://pypi.org/pypi/requests/json":
-            return _Response(
-                {
-                    "info": {"version": "1.2.4", "name": "requests"},
-                    "releases": {
-                        "1.2.4": [
-                            {
-                                "url": "https://pypi.org/packages/source/p/requests/requests-1.2.4.tar.gz",
-                                "digests": {"sha256": "dededede"},
-                            }
-                        ]
+                    {
+                        "url": "https://pypi.org/packages/2.7/p/hashin/hashin-0.10-py2-none-any.whl",
+                        "digests": {"sha256": "aaaaa"},
                     },
-                }
-            )
-        if url == "https://pypi.org/pypi/enum34/json":
-            return _Response(
-                {
-                    "info": {"version": "1.1.6", "name": "enum34"},
-                    "releases": {
-                        "1.1.6": [
-                            {
-                                "has_sig": False,
-                                "upload_time": "2016-05-16T03:31:13",
-                                "comment_text": "",
-                                "python_version": "py2",
-                                "url": "https://pypi.org/packages/c5/db/enum34-1.1.6-py2-none-any.whl",
-                                "digests": {
-                                    "md5": "68f6982cc07dde78f4b500db829860bd",
-                                    "sha256": "aaaaa",
-                                },
-                                "md5_digest": "68f6982cc07dde78f4b500db829860bd",
-                                "downloads": 4297423,
-                                "filename": "enum34-1.1.6-py2-none-any.whl",
-                                "packagetype": "bdist_wheel",
-                                "path": "c5/db/enum34-1.1.6-py2-none-any.whl",
-                                "size": 12427,
-                            },
-                            {
-                                "has_sig": False,
-                                "upload_time": "2016-05-16T03:31:19",
-                                "comment_text": "",
-                                "python_version": "py3",
-                                "url": "https://pypi.org/packages/af/42/enum34-1.1.6-py3-none-any.whl",
-                                "md5_digest": "a63ecb4f0b1b85fb69be64bdea999b43",
-                                "digests": {
-                                    "md5": "a63ecb4f0b1b85fb69be64bdea999b43",
-                                    "sha256": "bbbbb",
-                                },
-                                "downloads": 98598,
-                                "filename": "enum34-1.1.6-py3-none-any.whl",
-                                "packagetype": "bdist_wheel",
-                                "path": "af/42/enum34-1.1.6-py3-none-any.whl",
-                                "size": 12428,
-                            },
-                            {
-                                "has_sig": False,
-                                "upload_time": "2016-05-16T03:31:30",
-                                "comment_text": "",
-                                "python_version": "source",
-                                "url": "https://pypi.org/packages/bf/3e/enum34-1.1.6.tar.gz",
-                                "md5_digest": "5f13a0841a61f7fc295c514490d120d0",
-                                "digests": {
-                                    "md5": "5f13a0841a61f7fc295c514490d120d0",
-                                    "sha256": "ccccc",
-                                },
-                                "downloads": 188090,
-                                "filename": "enum34-1.1.6.tar.gz",
-                                "packagetype": "sdist",
-                                "path": "bf/3e/enum34-1.1.6.tar.gz",
-                                "size": 40048,
-                            },
-                            {
-                                "has_sig": False,
-                                "upload_time": "2016-05-16T03:31:48",
-                                "comment_text": "",
-                                "python_version": "source",
-                                "url": "https://pypi.org/packages/e8/26/enum34-1.1.6.zip",
-                                "md5_digest": "61ad7871532d4ce2d77fac2579237a9e",
-                                "digests": {
-                                    "md5": "61ad7871532d4ce2d77fac2579237a9e",
-                                    "sha256": "dddddd",
-                                },
-                                "downloads": 775920,
-                                "filename": "enum34-1.1.6.zip",
-                                "packagetype": "sdist",
-                                "path": "e8/26/enum34-1.1.6.zip",
-                                "size": 44773,
-                            },
-                        ]
+                    {
+                        "url": "https://pypi.org/packages/3.3/p/hashin/hashin-0.10-py3-none-any.whl",
+                        "digests": {"sha256": "bbbbb"},
                     },
-                }
-            )
-
-        raise NotImplementedError(url)
-
-    murlopen.side_effect = mocked_get
+                ]
+            },
+        }
+    )
 
-    with tmpfile() as filename:
-        before = (
-            """
-# This is comment. Ignore this.
+    retcode = hashin.run("hashin==0.10", requirements_file, "sha256")
 
-requests[security]==1.2.3 \\
-    --hash=sha256:99dcfdaae
-hashin==0.9 \\
-    --hash=sha256:12ce5c2ef718
-enum34==1.1.5; python_version <= '3.4' \\
-    --hash=sha256:12ce5c2ef718
+    assert retcode == 0
+    output = requirements_file.getvalue()
+    assert output
+    assert output.endswith("\n")
+    lines = output.splitlines()
 
-        """.strip()
-            + "\n"
-        )
-        with open(filename, "w") as f:
-            f.write(before)
+    assert lines[0] == "hashin==0.10 \\"
+    assert lines[1] == "    --hash=sha256:aaaaa \\"
+    assert lines[2] == "    --hash=sha256:bbbbb \\"
+    assert lines[3] == "    --hash=sha256:ccccc"
 
-        # Basically means we're saying "No" to all of them.
-        with mock.patch("hashin.input", return_value="N"):
-            retcode = hashin.run(None, filename, "sha256", interactive=True)
-        assert retcode == 0
 
-        with open(filename) as f:
-            output = f.read()
-            assert output == before
-
-        questions = []
-
-        def mock_input(question):
-            questions.append(question)
-            if len(questions) == 1:
-                # First one is "requests[security]"
-                return ""  # Default is "yes"
-            elif len(questions) == 2:
-                return "N"
-            elif len(questions) == 3:
-                return "Y"
-
-        with mock.patch("hashin.input") as mocked_input:
-            mocked_input.side_effect = mock_input
-            retcode = hashin.run(None, filename, "sha256", interactive=True)
-        assert retcode == 0
+def test_run_atomic_not_write_with_error_on_last_package(pypi_mock, requirements_file):
+    pypi_mock["https://pypi.org/pypi/hashin/json"] = _HASHIN_010_RESPONSE
+    pypi_mock["https://pypi.org/pypi/gobblygook/json"] = HTTPError(
+        "https://pypi.org/pypi/gobblygook/json", 404, "Page not found", {}, None
+    )
 
-        # The expected output is that only "requests[security]" and "enum34"
-        # get updated.
-        expected = (
-            """
-# This is comment. Ignore this.
-
-requests[security]==1.2.4 \\
-    --hash=sha256:dededede
-hashin==0.9 \\
-    --hash=sha256:12ce5c2ef718
-enum34==1.1.6; python_version <= "3.4" \\
-    --hash=sha256:aaaaa \\
-    --hash=sha256:bbbbb \\
-    --hash=sha256:ccccc \\
-    --hash=sha256:dddddd
-        """.strip()
-            + "\n"
-        )
-        with open(filename) as f:
-            output = f.read()
-            assert output == expected
+    with pytest.raises(hashin.PackageNotFoundError):
+        hashin.run(["hashin", "gobblygook"], requirements_file, "sha256", verbose=True)
 
+    # Crucial that nothing was written to the file.
+    # The first package would find some new requirements but the second
+    # package should cancel the write.
+    assert requirements_file.getvalue() == ""
 
-def test_run_interactive_quit_and_accept_all(murlopen, tmpfile, capsys):
-    def mocked_get(url, **options):
 
-        if url == "https://pypi.org/pypi/hashin/json":
-            return _Response(
-                {
-                    "info": {"version": "0.10", "name": "hashin"},
-                    "releases": {
-                        "0.10": [
-                            {
-                                "url": "https://pypi.org/packages/2.7/p/hashin/hashin-0.10-py2-none-any.whl",
-                                "digests": {"sha256": "aaaaa"},
-                            },
-                            {
-                                "url": "https://pypi.org/packages/3.3/p/hashin/hashin-0.10-py3-none-any.whl",
-                                "digests": {"sha256": "bbbbb"},
-                            },
-                            {
-                                "url": "https://pypi.org/packages/source/p/hashin/hashin-0.10.tar.gz",
-                                "digests": {"sha256": "ccccc"},
-                            },
-                        ]
-                    },
-                }
-            )
-        elif url == "https://pypi.org/pypi/requests/json":
-            return _Response(
-                {
-                    "info": {"version": "1.2.4", "name": "requests"},
-                    "releases": {
-                        "1.2.4": [
-                            {
-                                "url": "https://pypi.org/packages/source/p/requests/requests-1.2.4.tar.gz",
-                                "digests": {"sha256": "dededede"},
-                            }
-                        ]
-                    },
-                }
-            )
-        if url == "https://pypi.org/pypi/enum34/json":
-            return _Response(
-                {
-                    "info": {"version": "1.1.6", "name": "enum34"},
-                    "releases": {
-                        "1.1.6": [
-                            {
-                                "has_sig": False,
-                                "upload_time": "2016-05-16T03:31:13",
-                                "comment_text": "",
-                                "python_version": "py2",
-                                "url": "https://pypi.org/packages/c5/db/enum34-1.1.6-py2-none-any.whl",
-                                "digests": {
-                                    "md5": "68f6982cc07dde78f4b500db829860bd",
-                                    "sha256": "aaaaa",
-                                },
-                                "md5_digest": "68f6982cc07dde78f4b500db829860bd",
-                                "downloads": 4297423,
-                                "filename": "enum34-1.1.6-py2-none-any.whl",
-                                "packagetype": "bdist_wheel",
-                                "path": "c5/db/enum34-1.1.6-py2-none-any.whl",
-                                "size": 12427,
-                            },
-                            {
-                                "has_sig": False,
-                                "upload_time": "2016-05-16T03:31:19",
-                                "comment_text": "",
-                                "python_version": "py3",
-                                "url": "https://pypi.org/packages/af/42/enum34-1.1.6-py3-none-any.whl",
-                                "md5_digest": "a63ecb4f0b1b85fb69be64bdea999b43",
-                                "digests": {
-                                    "md5": "a63ecb4f0b1b85fb69be64bdea999b43",
-                                    "sha256": "bbbbb",
-                                },
-                                "downloads": 98598,
-                                "filename": "enum34-1.1.6-py3-none-any.whl",
-                                "packagetype": "bdist_wheel",
-                                "path": "af/42/enum34-1.1.6-py3-none-any.whl",
-                                "size": 12428,
-                            },
-                            {
-                                "has_sig": False,
-                                "upload_time": "2016-05-16T03:31:30",
-                                "comment_text": "",
-                                "python_version": "source",
-                                "url": "https://pypi.org/packages/bf/3e/enum34-1.1.6.tar.gz",
-                                "md5_digest": "5f13a0841a61f7fc295c514490d120d0",
-                                "digests": {
-                                    "md5": "5f13a0841a61f7fc295c514490d120d0",
-                                    "sha256": "ccccc",
-                                },
-                                "downloads": 188090,
-                                "filename": "enum34-1.1.6.tar.gz",
-                                "packagetype": "sdist",
-                                "path": "bf/3e/enum34-1.1.6.tar.gz",
-                                "size": 40048,
-                            },
-                            {
-                                "has_sig": False,
-                                "upload_time": "2016-05-16T03:31:48",
-                                "comment_text": "",
-                                "python_version": "source",
-                                "url": "https://pypi.org/packages/e8/26/enum34-1.1.6.zip",
-                                "md5_digest": "61ad7871532d4ce2d77fac2579237a9e",
-                                "digests": {
-                                    "md5": "61ad7871532d4ce2d77fac2579237a9e",
-                                    "sha256": "dddddd",
-                                },
-                                "downloads": 775920,
-                                "filename": "enum34-1.1.6.zip",
-                                "packagetype": "sdist",
-                                "path": "e8/26/enum34-1.1.6.zip",
-                                "size": 44773,
-                            },
-                        ]
-                    },
-                }
-            )
+def test_run_stops_looking_up_after_error(pypi_mock, requirements_file, monkeypatch):
+    monkeypatch.setattr(hashin, "MAX_WORKERS", 1)
+    pypi_mock["https://pypi.org/pypi/gobblygook/json"] = HTTPError(
+        "https://pypi.org/pypi/gobblygook/json", 404, "Page not found", {}, None
+    )
 
-        raise NotImplementedError(url)
+    lookup_cancelled = threading.Event()
+    cancel = concurrent.futures.Future.cancel
+
+    def record_cancel(future):
+        if cancel(future):
+            lookup_cancelled.set()
+            return True
+        return False
+
+    monkeypatch.setattr(concurrent.futures.Future, "cancel", record_cancel)
+
+    def waiting_not_found(url):
+        # If the only worker got to this lookup before the failed one could
+        # cancel it, hold on to the worker until the "hashin" one is
+        # cancelled instead.
+        assert lookup_cancelled.wait(timeout=5)
+        return HTTPError(url, 404, "Page not found", {}, None)
+
+    pypi_mock.register_prefix("https://pypi.org/pypi/waiting", waiting_not_found)
+    pypi_mock["https://pypi.org/pypi/hashin/json"] = _HASHIN_010_RESPONSE
+
+    with pytest.raises(hashin.PackageNotFoundError):
+        hashin.run(["gobblygook", "waiting", "hashin"], requirements_file, "sha256")
+
+    assert pypi_mock.calls[0] == "https://pypi.org/pypi/gobblygook/json"
+    assert "https://pypi.org/pypi/hashin/json" not in pypi_mock.calls
+
+
+_INTERACTIVE_BEFORE = (
+    "# This is comment. Ignore this.\n"
+    "\n"
+    "requests[security]==1.2.3 \\\n"
+    "    --hash=sha256:99dcfdaae\n"
+    "hashin==0.9 \\\n"
+    "    --hash=sha256:12ce5c2ef718\n"
+    "enum34==1.1.5; python_version <= '3.4' \\\n"
+    "    --hash=sha256:12ce5c2ef718\n"
+)
+
+# Only "requests[security]" and "enum34" get updated.
+_INTERACTIVE_SOME_UPDATED = (
+    "# This is comment. Ignore this.\n"
+    "\n"
+    "requests[security]==1.2.4 \\\n"
+    "    --hash=sha256:dededede\n"
+    "hashin==0.9 \\\n"
+    "    --hash=sha256:12ce5c2ef718\n"
+    'enum34==1.1.6; python_version <= "3.4" \\\n'
+    "    --hash=sha256:aaaaa \\\n"
+    "    --hash=sha256:bbbbb \\\n"
+    "    --hash=sha256:ccccc \\\n"
+    "    --hash=sha256:dddddd\n"
+)
+
+_INTERACTIVE_ALL_UPDATED = (
+    "# This is comment. Ignore this.\n"
+    "\n"
+    "requests[security]==1.2.4 \\\n"
+    "    --hash=sha256:dededede\n"
+    "hashin==0.10 \\\n"
+    "    --hash=sha256:aaaaa \\\n"
+    "    --hash=sha256:bbbbb \\\n"
+    "    --hash=sha256:ccccc\n"
+    'enum34==1.1.6; python_version <= "3.4" \\\n'
+    "    --hash=sha256:aaaaa \\\n"
+    "    --hash=sha256:bbbbb \\\n"
+    "    --hash=sha256:ccccc \\\n"
+    "    --hash=sha256:dddddd\n"
+)
+
+
+@pytest.fixture
+def update_all_pypi_mock(pypi_mock, enum34_response):
+    """`pypi_mock` with what the `--update-all` tests' requirements files pin,
+    apart from hashin, whose latest version is up to each test."""
+    pypi_mock["https://pypi.org/pypi/requests/json"] = _REQUESTS_124_RESPONSE
+    pypi_mock["https://pypi.org/pypi/enum34/json"] = enum34_response
+    return pypi_mock
+
+
+@pytest.fixture
+def interactive_requirements_file(requirements_file):
+    requirements_file.write(_INTERACTIVE_BEFORE)
+    return requirements_file
+
+
+@pytest.mark.parametrize(
+    "answers, expected_retcode, expected",
+    [
+        # Basically means we're saying "No" to all of them.
+        (["N", "N", "N"], 0, _INTERACTIVE_BEFORE),
+        # First one is "requests[security]" and the default is "yes".
+        (["", "N", "Y"], 0, _INTERACTIVE_SOME_UPDATED),
+        # Quitting asks no more questions and writes nothing.
+        (["q"], 1, _INTERACTIVE_BEFORE),
+        # Accepting all asks no more questions either.
+        (["A"], 0, _INTERACTIVE_ALL_UPDATED),
+    ],
+)
+def test_run_interactive(
+    update_all_pypi_mock,
+    interactive_requirements_file,
+    mock_input,
+    answers,
+    expected_retcode,
+    expected,
+):
+    update_all_pypi_mock["https://pypi.org/pypi/hashin/json"] = _HASHIN_010_RESPONSE
 
-    murlopen.side_effect = mocked_get
+    # An exhausted `side_effect` raises, so no extra questions can sneak in.
+    mock_input.side_effect = answers
+    retcode = hashin.run(
+        None, interactive_requirements_file, "sha256", interactive=True
+    )
+    assert retcode == expected_retcode
 
-    with tmpfile() as filename:
-        before = (
-            """
-# This is comment. Ignore this.
+    assert interactive_requirements_file.getvalue() == expected
 
-requests[security]==1.2.3 \\
-    --hash=sha256:99dcfdaae
-hashin==0.9 \\
-    --hash=sha256:12ce5c2ef718
-enum34==1.1.5; python_version <= '3.4' \\
-    --hash=sha256:12ce5c2ef718
+    # Every answer was used.
+    assert mock_input.call_count == len(answers)
 
-        """.strip()
-            + "\n"
-        )
-        with open(filename, "w") as f:
-            f.write(before)
-
-        questions = []
-
-        def mock_input(question):
-            questions.append(question)
-            if len(questions) == 1:
-                return "q"
-            elif len(questions) == 2:
-                return "A"
-            raise NotImplementedError(questions)
-
-        with mock.patch("hashin.input") as mocked_input:
-            mocked_input.side_effect = mock_input
-            retcode = hashin.run(None, filename, "sha256", interactive=True)
-        assert retcode != 0
-        assert len(questions) == 1
-
-        with open(filename) as f:
-            output = f.read()
-            assert output == before
-
-        with mock.patch("hashin.input") as mocked_input:
-            mocked_input.side_effect = mock_input
-            retcode = hashin.run(None, filename, "sha256", interactive=True)
-        assert retcode == 0
 
-        # The expected output is that only "requests[security]" and "enum34"
-        # get updated.
-        expected = (
-            """
-# This is comment. Ignore this.
-
-requests[security]==1.2.4 \\
-    --hash=sha256:dededede
-hashin==0.10 \\
-    --hash=sha256:aaaaa \\
-    --hash=sha256:bbbbb \\
-    --hash=sha256:ccccc
-enum34==1.1.6; python_version <= "3.4" \\
-    --hash=sha256:aaaaa \\
-    --hash=sha256:bbbbb \\
-    --hash=sha256:ccccc \\
-    --hash=sha256:dddddd
-        """.strip()
-            + "\n"
-        )
-        with open(filename) as f:
-            output = f.read()
-            assert output == expected
+_CASE_REDIRECT_BEFORE = (
+    "Django==2.1.2 \\\n"
+    "    --hash=sha256:efbcad7ebb47daafbcead109b38a5bd519a3c3cd92c6ed0f691ff97fcdd16b45\n"
+    "\n"
+    "Hash-in==0.9 \\\n"
+    "    --hash=sha256:12ce5c2ef718\n"
+)
 
-        # No more questions were asked of `input()`.
-        assert len(questions) == 2
+# Both get updated and "Hash-in" is rewritten to its canonical name.
+_CASE_REDIRECT_EXPECTED = (
+    "Django==2.1.3 \\\n"
+    "    --hash=sha256:dd46d87af4c1bf54f4c926c3cfa41dc2b5c15782f15e4329752ce65f5dad1c37\n"
+    "\n"
+    "hashin==0.10 \\\n"
+    "    --hash=sha256:aaaaa \\\n"
+    "    --hash=sha256:bbbbb \\\n"
+    "    --hash=sha256:ccccc\n"
+)
 
 
-def test_run_interactive_case_redirect(murlopen, tmpfile, capsys):
+def test_run_interactive_case_redirect(pypi_mock, requirements_file, mock_input):
     """This test tests if you had a requirements file with packages spelled
     with a different name."""
 
-    def mocked_get(url, **options):
-
-        # Note that the name "Hash-in" redirects to a name that is not only
-        # different case, it's also spelled totally differently.
-        if url == "https://pypi.org/pypi/Hash-in/json":
-            return _Response(
-                {
-                    "info": {"version": "0.10", "name": "hashin"},
-                    "releases": {
-                        "0.10": [
-                            {
-                                "url": "https://pypi.org/packages/2.7/p/hashin/hashin-0.10-py2-none-any.whl",
-                                "digests": {"sha256": "aaaaa"},
-                            },
-                            {
-                                "url": "https://pypi.org/packages/3.3/p/hashin/hashin-0.10-py3-none-any.whl",
-                                "digests": {"sha256": "bbbbb"},
-                            },
-                            {
-                                "url": "https://pypi.org/packages/source/p/hashin/hashin-0.10.tar.gz",
-                                "digests": {"sha256": "ccccc"},
-                            },
-                        ]
-                    },
-                }
-            )
-
-        if url == "https://pypi.org/pypi/Django/json":
-            return _Response(
-                {
-                    "info": {"version": "2.1.3", "name": "Django"},
-                    "releases": {
-                        "2.1.3": [
-                            {
-                                "url": "https://files.pythonhosted.org/packages/d1/e5/2676/Django-2.1.3-py3-none-any.whl",
-                                "digests": {
-                                    "sha256": "dd46d87af4c1bf54f4c926c3cfa41dc2b5c15782f15e4329752ce65f5dad1c37"
-                                },
-                            }
-                        ]
-                    },
-                }
-            )
-
-        raise NotImplementedError(url)
-
-    murlopen.side_effect = mocked_get
+    # Note that the name "Hash-in" redirects to a name that is not only
+    # different case, it's also spelled totally differently.
+    pypi_mock["https://pypi.org/pypi/Hash-in/json"] = _HASHIN_010_RESPONSE
+    pypi_mock["https://pypi.org/pypi/Django/json"] = _Response(
+        {
+            "info": {"version": "2.1.3", "name": "Django"},
+            "releases": {
+                "2.1.3": [
+                    {
+                        "url": "https://files.pythonhosted.org/packages/d1/e5/2676/Django-2.1.3-py3-none-any.whl",
+                        "digests": {
+                            "sha256": "dd46d87af4c1bf54f4c926c3cfa41dc2b5c15782f15e4329752ce65f5dad1c37"
+                        },
+                    }
+                ]
+            },
+        }
+    )
 
-    with tmpfile() as filename:
-        before = (
-            """
-Django==2.1.2 \\
-    --hash=sha256:efbcad7ebb47daafbcead109b38a5bd519a3c3cd92c6ed0f691ff97fcdd16b45
+    requirements_file.write(_CASE_REDIRECT_BEFORE)
 
-Hash-in==0.9 \\
-    --hash=sha256:12ce5c2ef718
-        """.strip()
-            + "\n"
-        )
-        with open(filename, "w") as f:
-            f.write(before)
+    assert requirements_file.getvalue() == _CASE_REDIRECT_BEFORE
 
-        with open(filename) as f:
-            output = f.read()
-            assert output == before
+    mock_input.return_value = "Y"
+    retcode = hashin.run(None, requirements_file, "sha256", interactive=True)
+    assert retcode == 0
 
-        with mock.patch("hashin.input", return_value="Y"):
-            retcode = hashin.run(None, filename, "sha256", interactive=True)
-        assert retcode == 0
+    assert requirements_file.getvalue() == _CASE_REDIRECT_EXPECTED
 
-        # The expected output is that only "requests[security]" and "enum34"
-        # get updated.
-        expected = (
-            """
-Django==2.1.3 \\
-    --hash=sha256:dd46d87af4c1bf54f4c926c3cfa41dc2b5c15782f15e4329752ce65f5dad1c37
-
-hashin==0.10 \\
-    --hash=sha256:aaaaa \\
-    --hash=sha256:bbbbb \\
-    --hash=sha256:ccccc
-        """.strip()
-            + "\n"
-        )
-        with open(filename) as f:
-            output = f.read()
-            assert output == expected
 
+def test_run_replaces_file_in_one_go(pypi_mock, tmp_path):
+    pypi_mock["https://pypi.org/pypi/hashin/json"] = _HASHIN_010_RESPONSE
 
-def test_run_without_specific_version(murlopen, tmpfile):
-    def mocked_get(url, **options):
-        if url == "https://pypi.org/pypi/hashin/json":
-            return _Response(
-                {
-                    "info": {"version": "0.10", "name": "hashin"},
-                    "releases": {
-                        "0.10": [
-                            {
-                                "url": "https://pypi.org/packages/2.7/p/hashin/hashin-0.10-py2-none-any.whl",
-                                "digests": {"sha256": "aaaaa"},
-                            },
-                            {
-                                "url": "https://pypi.org/packages/3.3/p/hashin/hashin-0.10-py3-none-any.whl",
-                                "digests": {"sha256": "bbbbb"},
-                            },
-                            {
-                                "url": "https://pypi.org/packages/source/p/hashin/hashin-0.10.tar.gz",
-                                "digests": {"sha256": "ccccc"},
-                            },
-                        ]
-                    },
-                }
-            )
+    real_file = tmp_path / "real-requirements.txt"
+    real_file.write_text("# Pinned\n")
+    real_file.chmod(0o640)
+    filename = tmp_path / "requirements.txt"
+    filename.symlink_to(real_file)
 
-        raise NotImplementedError(url)
+    retcode = hashin.run("hashin==0.10", str(filename), "sha256")
+    assert retcode == 0
 
-    murlopen.side_effect = mocked_get
+    # The symlink is left alone and the file it points to got written.
+    assert filename.is_symlink()
+    assert real_file.read_text().startswith("# Pinned\nhashin==0.10 \\\n")
+    assert real_file.stat().st_mode & 0o777 == 0o640
+    # No temporary files are left behind.
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "real-requirements.txt",
+        "requirements.txt",
+    ]
 
-    with tmpfile() as filename:
-        with open(filename, "w") as f:
-            f.write("")
 
-        retcode = hashin.run("hashin", filename, "sha256", verbose=True)
+def test_run_without_specific_version(pypi_mock, requirements_file):
+    pypi_mock["https://pypi.org/pypi/hashin/json"] = _HASHIN_010_RESPONSE
 
-        assert retcode == 0
-        with open(filename) as f:
-            output = f.read()
-        assert output.startswith("hashin==0.10")
+    retcode = hashin.run("hashin", requirements_file, "sha256", verbose=True)
 
+    assert retcode == 0
+    assert requirements_file.getvalue().startswith("hashin==0.10")
 
-def test_run_with_alternate_index_url(murlopen, tmpfile):
-    def mocked_get(url, **options):
-        if url == "https://pypi.internal.net/pypi/hashin/json":
-            return _Response(
-                {
-                    "info": {"version": "0.10", "name": "hashin"},
-                    "releases": {
-                        "0.10": [
-                            {
-                                "url": "https://pypi.internal.net/packages/2.7/p/hashin/hashin-0.10-py2-none-any.whl",
-                                "digests": {"sha256": "aaaaa"},
-                            },
-                            {
-                                "url": "https://pypi.internal.net/packages/3.3/p/hashin/hashin-0.10-py3-none-any.whl",
-                                "digests": {"sha256": "bbbbb"},
-                            },
-                            {
-                                "url": "https://pypi.internal.net/packages/source/p/hashin/hashin-0.10.tar.gz",
-                                "digests": {"sha256": "ccccc"},
-                            },
-                        ]
-                    },
-                }
-            )
 
-        raise NotImplementedError(url)
+def test_run_with_alternate_index_url(pypi_mock, requirements_file):
+    pypi_mock["https://pypi.internal.net/pypi/hashin/json"] = _Response(
+        _hashin_010_payload("https://pypi.internal.net/")
+    )
 
-    murlopen.side_effect = mocked_get
+    retcode = hashin.run(
+        "hashin",
+        requirements_file,
+        "sha256",
+        verbose=True,
+        index_url="https://pypi.internal.net/",
+    )
 
-    with tmpfile() as filename:
-        with open(filename, "w") as f:
-            f.write("")
+    assert retcode == 0
+    assert requirements_file.getvalue().startswith("hashin==0.10")
 
-        retcode = hashin.run(
-            "hashin",
-            filename,
-            "sha256",
-            verbose=True,
-            index_url="https://pypi.internal.net/",
-        )
 
-        assert retcode == 0
-        with open(filename) as f:
-            output = f.read()
-        assert output.startswith("hashin==0.10")
+@pytest.fixture
+def contained_names_mock(pypi_mock):
+    pypi_mock["https://pypi.org/pypi/django-redis/json"] = _sdist_response(
+        "django-redis", ("4.7.0", "aaaaa")
+    )
+    pypi_mock[
+        "https://pypi.org/packages/source/p/django-redis/django-redis-4.7.0.tar.gz"
+    ] = _Response(b"Some tarball content\n")
+    pypi_mock["https://pypi.org/pypi/redis/json"] = _sdist_response(
+        "redis", ("2.10.5", "bbbbb")
+    )
+    yield pypi_mock
 
 
-def test_run_contained_names(murlopen, tmpfile):
+def test_run_contained_names(contained_names_mock, requirements_file):
     """
     This is based on https://github.com/peterbe/hashin/issues/35
     which was a real bug discovered in hashin 0.8.0.
@@ -1448,385 +1129,136 @@ def test_run_contained_names(murlopen, tmpfile):
     in the first package's name.
     """
 
-    def mocked_get(url, **options):
-        if url == "https://pypi.org/pypi/django-redis/json":
-            return _Response(
-                {
-                    "info": {"version": "4.7.0", "name": "django-redis"},
-                    "releases": {
-                        "4.7.0": [
-                            {
-                                "url": "https://pypi.org/packages/source/p/django-redis/django-redis-4.7.0.tar.gz",
-                                "digests": {"sha256": "aaaaa"},
-                            }
-                        ]
-                    },
-                }
-            )
-        elif (
-            url
-            == "https://pypi.org/packages/source/p/django-redis/django-redis-4.7.0.tar.gz"
-        ):
-            return _Response(b"Some tarball content\n")
-        elif url == "https://pypi.org/pypi/redis/json":
-            return _Response(
-                {
-                    "info": {"version": "2.10.5", "name": "redis"},
-                    "releases": {
-                        "2.10.5": [
-                            {
-                                "url": "https://pypi.org/packages/source/p/redis/redis-2.10.5.tar.gz",
-                                "digests": {"sha256": "bbbbb"},
-                            }
-                        ]
-                    },
-                }
-            )
-
-        raise NotImplementedError(url)
+    retcode = hashin.run(
+        "django-redis==4.7.0", requirements_file, "sha256", verbose=True
+    )
 
-    murlopen.side_effect = mocked_get
+    assert retcode == 0
+    output = requirements_file.getvalue()
+    assert output.endswith("\n")
+    assert output.count("\n") == 2
+    assert output.startswith("django-redis==4.7.0 \\\n")
 
-    with tmpfile() as filename:
-        with open(filename, "w") as f:
-            f.write("")
+    # Now install the next package whose name is contained
+    # in the first one.
+    retcode = hashin.run("redis==2.10.5", requirements_file, "sha256", verbose=True)
 
-        retcode = hashin.run("django-redis==4.7.0", filename, "sha256", verbose=True)
+    assert retcode == 0
+    output = requirements_file.getvalue()
+    assert output.endswith("\n")
+    assert output.count("\n") == 4
+    assert output.startswith("django-redis==4.7.0 \\\n")
+    assert "\nredis==2.10.5 \\\n" in output
 
-        assert retcode == 0
-        with open(filename) as f:
-            output = f.read()
-        assert output.endswith("\n")
-        lines = output.splitlines()
-        assert "django-redis==4.7.0 \\" in lines
-        assert len(lines) == 2
 
-        # Now install the next package whose name is contained
-        # in the first one.
-        retcode = hashin.run("redis==2.10.5", filename, "sha256", verbose=True)
+def test_run_contained_names_in_one_run(contained_names_mock, requirements_file):
+    retcode = hashin.run(
+        ["django-redis==4.7.0", "redis==2.10.5"], requirements_file, "sha256"
+    )
 
-        assert retcode == 0
-        with open(filename) as f:
-            output = f.read()
-        assert output.endswith("\n")
-        lines = output.splitlines()
-        assert "django-redis==4.7.0 \\" in lines
-        assert "redis==2.10.5 \\" in lines
-        assert len(lines) == 4
+    assert retcode == 0
+    assert requirements_file.getvalue() == (
+        "django-redis==4.7.0 \\\n"
+        "    --hash=sha256:aaaaa\n"
+        "redis==2.10.5 \\\n"
+        "    --hash=sha256:bbbbb\n"
+    )
 
 
-def test_run_case_insensitive(murlopen, tmpfile):
+def test_run_case_insensitive(update_all_pypi_mock, tmp_path):
     """No matter how you run the cli with a package's case typing,
     it should find it and correct the cast typing per what it is
     inside the PyPI data."""
 
-    def mocked_get(url, **options):
-        if url == "https://pypi.org/pypi/hashin/json":
-            return _Response(
-                {
-                    "info": {"version": "0.11", "name": "hashin"},
-                    "releases": {
-                        "0.11": [
-                            {
-                                "url": "https://pypi.org/packages/source/p/hashin/hashin-0.11.tar.gz",
-                                "digests": {"sha256": "bbbbb"},
-                            }
-                        ],
-                        "0.10": [
-                            {
-                                "url": "https://pypi.org/packages/source/p/hashin/hashin-0.10.tar.gz",
-                                "digests": {"sha256": "aaaaa"},
-                            }
-                        ],
-                    },
-                }
-            )
-        elif url == "https://pypi.org/pypi/hashin/json":
-            return _Response(
-                {
-                    "info": {"version": "0.11", "name": "hashin"},
-                    "releases": {
-                        "0.11": [
-                            {
-                                "url": "https://pypi.org/packages/source/p/hashin/hashin-0.11.tar.gz",
-                                "digests": {"sha256": "bbbbb"},
-                            }
-                        ],
-                        "0.10": [
-                            {
-                                "url": "https://pypi.org/packages/source/p/hashin/hashin-0.10.tar.gz",
-                                "digests": {"sha256": "aaaaa"},
-                            }
-                        ],
-                    },
-                }
-            )
-        elif url == "https://pypi.org/pypi/requests/json":
-            return _Response(
-                {
-                    "info": {"version": "1.2.4", "name": "requests"},
-                    "releases": {
-                        "1.2.4": [
-                            {
-                                "url": "https://pypi.org/packages/source/p/requests/requests-1.2.4.tar.gz",
-                                "digests": {"sha256": "dededede"},
-                            }
-                        ]
-                    },
-                }
-            )
-        if url == "https://pypi.org/pypi/enum34/json":
-            return _Response(
-                {
-                    "info": {"version": "1.1.6", "name": "enum34"},
-                    "releases": {
-                        "1.1.6": [
-                            {
-                                "has_sig": False,
-                                "upload_time": "2016-05-16T03:31:13",
-                                "comment_text": "",
-                                "python_version": "py2",
-                                "url": "https://pypi.org/packages/c5/db/enum34-1.1.6-py2-none-any.whl",
-                                "digests": {
-                                    "md5": "68f6982cc07dde78f4b500db829860bd",
-                                    "sha256": "aaaaa",
-                                },
-                                "md5_digest": "68f6982cc07dde78f4b500db829860bd",
-                                "downloads": 4297423,
-                                "filename": "enum34-1.1.6-py2-none-any.whl",
-                                "packagetype": "bdist_wheel",
-                                "path": "c5/db/enum34-1.1.6-py2-none-any.whl",
-                                "size": 12427,
-                            },
-                            {
-                                "has_sig": False,
-                                "upload_time": "2016-05-16T03:31:19",
-                                "comment_text": "",
-                                "python_version": "py3",
-                                "url": "https://pypi.org/packages/af/42/enum34-1.1.6-py3-none-any.whl",
-                                "md5_digest": "a63ecb4f0b1b85fb69be64bdea999b43",
-                                "digests": {
-                                    "md5": "a63ecb4f0b1b85fb69be64bdea999b43",
-                                    "sha256": "bbbbb",
-                                },
-                                "downloads": 98598,
-                                "filename": "enum34-1.1.6-py3-none-any.whl",
-                                "packagetype": "bdist_wheel",
-                                "path": "af/42/enum34-1.1.6-py3-none-any.whl",
-                                "size": 12428,
-                            },
-                            {
-                                "has_sig": False,
-                                "upload_time": "2016-05-16T03:31:30",
-                                "comment_text": "",
-                                "python_version": "source",
-                                "url": "https://pypi.org/packages/bf/3e/enum34-1.1.6.tar.gz",
-                                "md5_digest": "5f13a0841a61f7fc295c514490d120d0",
-                                "digests": {
-                                    "md5": "5f13a0841a61f7fc295c514490d120d0",
-                                    "sha256": "ccccc",
-                                },
-                                "downloads": 188090,
-                                "filename": "enum34-1.1.6.tar.gz",
-                                "packagetype": "sdist",
-                                "path": "bf/3e/enum34-1.1.6.tar.gz",
-                                "size": 40048,
-                            },
-                            {
-                                "has_sig": False,
-                                "upload_time": "2016-05-16T03:31:48",
-                                "comment_text": "",
-                                "python_version": "source",
-                                "url": "https://pypi.org/packages/e8/26/enum34-1.1.6.zip",
-                                "md5_digest": "61ad7871532d4ce2d77fac2579237a9e",
-                                "digests": {
-                                    "md5": "61ad7871532d4ce2d77fac2579237a9e",
-                                    "sha256": "dddddd",
-                                },
-                                "downloads": 775920,
-                                "filename": "enum34-1.1.6.zip",
-                                "packagetype": "sdist",
-                                "path": "e8/26/enum34-1.1.6.zip",
-                                "size": 44773,
-                            },
-                        ]
-                    },
-                }
-            )
-
-        raise NotImplementedError(url)
+    update_all_pypi_mock["https://pypi.org/pypi/hashin/json"] = _HASHIN_011_RESPONSE
 
-    murlopen.side_effect = mocked_get
+    filename = tmp_path / "requirements.txt"
+    with pytest.raises(FileNotFoundError):
+        hashin.run(None, filename, "sha256")
 
-    with tmpfile() as filename:
-        with pytest.raises(FileNotFoundError):
-            hashin.run(None, filename, "sha256")
-
-        with open(filename, "w") as f:
-            f.write("# This is comment. Ignore this.\n")
-            f.write("\n")
-            f.write("requests[security]==1.2.3 \\\n")
-            f.write("    --hash=sha256:99dcfdaae\n")
-            f.write("hashin==0.11 \\\n")
-            f.write("    --hash=sha256:a84b8c9ab623\n")
-            f.write("enum34==1.1.5; python_version <= '3.4' \\\n")
-            f.write("    --hash=sha256:12ce5c2ef718\n")
-            f.write("\n")
+    filename.write_text(
+        "# This is comment. Ignore this.\n"
+        "\n"
+        "requests[security]==1.2.3 \\\n"
+        "    --hash=sha256:99dcfdaae\n"
+        "hashin==0.11 \\\n"
+        "    --hash=sha256:a84b8c9ab623\n"
+        "enum34==1.1.5; python_version <= '3.4' \\\n"
+        "    --hash=sha256:12ce5c2ef718\n"
+        "\n"
+    )
 
-        retcode = hashin.run(None, filename, "sha256", verbose=True)
+    retcode = hashin.run(None, filename, "sha256", verbose=True)
 
-        assert retcode == 0
-        with open(filename) as f:
-            output = f.read()
+    assert retcode == 0
+    output = filename.read_text()
 
-        assert "requests[security]==1.2.3" not in output
-        assert "requests[security]==1.2.4" in output
-        # This one didn't need to be updated.
-        assert "hashin==0.11" in output
-        assert 'enum34==1.1.5; python_version <= "3.4"' not in output
-        assert 'enum34==1.1.6; python_version <= "3.4"' in output
+    assert "requests[security]==1.2.3" not in output
+    assert "requests[security]==1.2.4" in output
+    # This one didn't need to be updated.
+    assert "hashin==0.11" in output
+    assert 'enum34==1.1.5; python_version <= "3.4"' not in output
+    assert 'enum34==1.1.6; python_version <= "3.4"' in output
 
 
-def test_run_update_all(murlopen, tmpfile):
+def test_run_update_all(pypi_mock, requirements_file):
     """The --update-all flag will extra all the names from the existing
     requirements file, and check with pypi.org if there's a new version."""
 
-    def mocked_get(url, **options):
-        if url in (
-            "https://pypi.org/pypi/HAShin/json",
-            "https://pypi.org/pypi/hashIN/json",
-        ):
-            return _Response(
-                {
-                    "info": {"version": "0.11", "name": "hashin"},
-                    "releases": {
-                        "0.11": [
-                            {
-                                "url": "https://pypi.org/packages/source/p/hashin/hashin-0.11.tar.gz",
-                                "digests": {"sha256": "bbbbb"},
-                            }
-                        ],
-                        "0.10": [
-                            {
-                                "url": "https://pypi.org/packages/source/p/hashin/hashin-0.10.tar.gz",
-                                "digests": {"sha256": "aaaaa"},
-                            }
-                        ],
-                    },
-                }
-            )
-
-        raise NotImplementedError(url)
+    pypi_mock["https://pypi.org/pypi/HAShin/json"] = _HASHIN_011_RESPONSE
+    pypi_mock["https://pypi.org/pypi/hashIN/json"] = _HASHIN_011_RESPONSE
 
-    murlopen.side_effect = mocked_get
+    retcode = hashin.run("HAShin==0.10", requirements_file, "sha256", verbose=True)
 
-    with tmpfile() as filename:
-        with open(filename, "w") as f:
-            f.write("")
+    assert retcode == 0
+    output = requirements_file.getvalue()
+    assert output.endswith("\n")
+    lines = output.splitlines()
+    assert lines[0] == "hashin==0.10 \\"
 
-        retcode = hashin.run("HAShin==0.10", filename, "sha256", verbose=True)
+    # Change version
+    retcode = hashin.run("hashIN==0.11", requirements_file, "sha256")
+    assert retcode == 0
+    output = requirements_file.getvalue()
+    assert output.endswith("\n")
+    lines = output.splitlines()
+    assert lines[0] == "hashin==0.11 \\"
 
-        assert retcode == 0
-        with open(filename) as f:
-            output = f.read()
-        assert output.endswith("\n")
-        lines = output.splitlines()
-        assert lines[0] == "hashin==0.10 \\"
-
-        # Change version
-        retcode = hashin.run("hashIN==0.11", filename, "sha256")
-        assert retcode == 0
-        with open(filename) as f:
-            output = f.read()
-        assert output.endswith("\n")
-        lines = output.splitlines()
-        assert lines[0] == "hashin==0.11 \\"
 
-
-def test_run_comments_with_package_spec_patterns(murlopen, tmpfile, capsys):
+def test_run_comments_with_package_spec_patterns(pypi_mock, requirements_file):
     """Based on https://github.com/peterbe/hashin/issues/103
     Essentially, the regex that looks for package specs in each line of the
     requirements file might pick up lines that are actually comments.
     """
 
-    def mocked_get(url, **options):
-        if url == "https://pypi.org/pypi/hashin/json":
-            return _Response(
-                {
-                    "info": {"version": "0.11", "name": "hashin"},
-                    "releases": {
-                        "0.11": [
-                            {
-                                "url": "https://pypi.org/packages/source/p/hashin/hashin-0.11.tar.gz",
-                                "digests": {"sha256": "bbbbb"},
-                            }
-                        ],
-                        "0.10": [
-                            {
-                                "url": "https://pypi.org/packages/source/p/hashin/hashin-0.10.tar.gz",
-                                "digests": {"sha256": "aaaaa"},
-                            }
-                        ],
-                    },
-                }
-            )
-
-    murlopen.side_effect = mocked_get
+    pypi_mock["https://pypi.org/pypi/hashin/json"] = _HASHIN_011_RESPONSE
 
-    with tmpfile() as filename:
-        with open(filename, "w") as f:
-            f.write("# Hey, don't use hashin==1.2.3 \n")
-            f.write("hashin==0.11 \\\n")
-            f.write("    --hash=sha256:bbbbb\n")
-            f.write("\n")
+    requirements_file.write(
+        "# Hey, don't use hashin==1.2.3 \n"
+        "hashin==0.11 \\\n"
+        "    --hash=sha256:bbbbb\n"
+        "\n"
+    )
 
-        retcode = hashin.run([], filename, "sha256")
-        # Since this is based a stupidity test, just be content that it works.
-        assert retcode == 0
+    retcode = hashin.run([], requirements_file, "sha256")
+    # Since this is based a stupidity test, just be content that it works.
+    assert retcode == 0
 
 
-def test_run_dry(murlopen, tmpfile, capsys):
+def test_run_dry(pypi_mock, requirements_file, capsys):
     """dry run should not edit the requirements file and print
     hashes and package name in the console
     """
 
-    def mocked_get(url, **options):
-        if url == "https://pypi.org/pypi/hashin/json":
-            return _Response(
-                {
-                    "info": {"version": "0.11", "name": "hashin"},
-                    "releases": {
-                        "0.11": [
-                            {
-                                "url": "https://pypi.org/packages/source/p/hashin/hashin-0.11.tar.gz",
-                                "digests": {"sha256": "bbbbb"},
-                            }
-                        ],
-                        "0.10": [
-                            {
-                                "url": "https://pypi.org/packages/source/p/hashin/hashin-0.10.tar.gz",
-                                "digests": {"sha256": "aaaaa"},
-                            }
-                        ],
-                    },
-                }
-            )
-
-    murlopen.side_effect = mocked_get
+    pypi_mock["https://pypi.org/pypi/hashin/json"] = _HASHIN_011_RESPONSE
 
-    with tmpfile() as filename:
-        with open(filename, "w") as f:
-            f.write("")
-
-        retcode = hashin.run(
-            "hashin==0.10", filename, "sha256", verbose=False, dry_run=True
-        )
-        assert retcode == 0
+    retcode = hashin.run(
+        "hashin==0.10", requirements_file, "sha256", verbose=False, dry_run=True
+    )
+    assert retcode == 0
 
-        # verify that nothing has been written to file
-        with open(filename) as f:
-            output = f.read()
-        assert not output
+    # verify that nothing has been written to file
+    assert not requirements_file.getvalue()
 
     # Check dry run output
     captured = capsys.readouterr()
@@ -1835,64 +1267,21 @@ def test_run_dry(murlopen, tmpfile, capsys):
     assert "+--hash=sha256:aaaaa" in out_lines[4].replace(" ", "")
 
 
-def test_run_dry_multiple_packages(murlopen, tmpfile, capsys):
+def test_run_dry_multiple_packages(pypi_mock, requirements_file, capsys):
     """dry run should edit the requirements.txt file and print
     hashes and package name in the console
     """
 
-    def mocked_get(url, **options):
-        if url == "https://pypi.org/pypi/hashin/json":
-            return _Response(
-                {
-                    "info": {"version": "0.11", "name": "hashin"},
-                    "releases": {
-                        "0.11": [
-                            {
-                                "url": "https://pypi.org/packages/source/p/hashin/hashin-0.11.tar.gz",
-                                "digests": {"sha256": "bbbbb"},
-                            }
-                        ],
-                        "0.10": [
-                            {
-                                "url": "https://pypi.org/packages/source/p/hashin/hashin-0.10.tar.gz",
-                                "digests": {"sha256": "aaaaa"},
-                            }
-                        ],
-                    },
-                }
-            )
-        if url == "https://pypi.org/pypi/requests/json":
-            return _Response(
-                {
-                    "info": {"version": "1.2.4", "name": "requests"},
-                    "releases": {
-                        "1.2.4": [
-                            {
-                                "url": "https://pypi.org/packages/source/p/requests/requests-1.2.4.tar.gz",
-                                "digests": {"sha256": "dededede"},
-                            }
-                        ]
-                    },
-                }
-            )
-
-        raise NotImplementedError(url)
-
-    murlopen.side_effect = mocked_get
+    pypi_mock["https://pypi.org/pypi/hashin/json"] = _HASHIN_011_RESPONSE
+    pypi_mock["https://pypi.org/pypi/requests/json"] = _REQUESTS_124_RESPONSE
 
-    with tmpfile() as filename:
-        with open(filename, "w") as f:
-            f.write("")
-
-        retcode = hashin.run(
-            ["hashin", "requests"], filename, "sha256", verbose=False, dry_run=True
-        )
-        assert retcode == 0
+    retcode = hashin.run(
+        ["hashin", "requests"], requirements_file, "sha256", verbose=False, dry_run=True
+    )
+    assert retcode == 0
 
-        # verify that nothing has been written to file
-        with open(filename) as f:
-            output = f.read()
-        assert not output
+    # verify that nothing has been written to file
+    assert not requirements_file.getvalue()
 
     # Check dry run output
     captured = capsys.readouterr()
@@ -1906,7 +1295,107 @@ def test_run_dry_multiple_packages(murlopen, tmpfile, capsys):
     assert "+--hash=sha256:dededede" in out_lines[6].replace(" ", "")
 
 
-def test_run_pep_0496(murlopen, tmpfile):
+def test_run_multiple_packages_concurrently(pypi_mock, requirements_file):
+    for name, version in (("hashin", "0.10"), ("requests", "1.2.4")):
+        pypi_mock[f"https://pypi.org/pypi/{name}/json"] = _Response(
+            {
+                "info": {"version": version, "name": name},
+                "releases": {
+                    version: [
+                        {
+                            "url": f"https://pypi.org/packages/source/{name}-{version}.tar.gz",
+                            # No digests, so the file has to be downloaded.
+                            "digests": {},
+                        }
+                    ]
+                },
+            }
+        )
+
+    requests_downloaded = threading.Event()
+
+    def hashin_tarball(url):
+        # Only answers once the "requests" file has been downloaded too,
+        # which can't happen if the packages are done one after the other.
+        assert requests_downloaded.wait(timeout=5)
+        return _Response(b"Some hashin tarball\n")
+
+    def requests_tarball(url):
+        requests_downloaded.set()
+        return _Response(b"Some requests tarball\n")
+
+    pypi_mock.register_prefix(
+        "https://pypi.org/packages/source/hashin-0.10.tar.gz", hashin_tarball
+    )
+    pypi_mock.register_prefix(
+        "https://pypi.org/packages/source/requests-1.2.4.tar.gz", requests_tarball
+    )
+
+    retcode = hashin.run(["hashin", "requests"], requirements_file, "sha256")
+    assert retcode == 0
+
+    # Still in the order they were asked for.
+    assert requirements_file.getvalue() == (
+        "hashin==0.10 \\\n"
+        "    --hash=sha256:bde959d310ec442b67acb28e8fe0e467e75823906e3bf49d53cc67d4be7843da\n"
+        "requests==1.2.4 \\\n"
+        "    --hash=sha256:c351c496e4a7f9b830574318ec21535a5a70df6a0809f5feb8349b26023af388\n"
+    )
+
+
+def test_run_downloads_share_slots(pypi_mock, requirements_file, monkeypatch):
+    monkeypatch.setattr(hashin, "_download_slots", threading.BoundedSemaphore(1))
+    for name, version in (("hashin", "0.10"), ("requests", "1.2.4")):
+        pypi_mock[f"https://pypi.org/pypi/{name}/json"] = _Response(
+            {
+                "info": {"version": version, "name": name},
+                "releases": {
+                    version: [
+                        {
+                            "url": f"https://pypi.org/packages/{python}/{name}-{version}-{python}-none-any.whl",
+                            # No digests, so the file has to be downloaded.
+                            "digests": {},
+                        }
+                        for python in ("py2", "py3")
+                    ]
+                },
+            }
+        )
+
+    def wheel(url):
+        # Whichever lookup this download is for, it holds the only slot.
+        assert not hashin._download_slots.acquire(blocking=False)
+        return _Response(b"Some wheel\n")
+
+    pypi_mock.register_prefix("https://pypi.org/packages/", wheel)
+
+    retcode = hashin.run(["hashin", "requests"], requirements_file, "sha256")
+    assert retcode == 0
+    assert len(pypi_mock.calls) == 6
+
+
+def test_download_release_interrupted(pypi_mock, download_dir):
+    url = "https://pypi.org/packages/source/hashin-0.10.tar.gz"
+    response = mock.Mock()
+    response.getcode.return_value = 200
+    response.read.side_effect = [b"Some hashin", ConnectionResetError()]
+    pypi_mock[url] = response
+
+    with pytest.raises(ConnectionResetError):
+        hashin._download_release(url)
+    # Nothing half-downloaded is left behind to be re-used.
+    assert list(download_dir.iterdir()) == []
+
+    pypi_mock[url] = _Response(b"Some hashin tarball\n")
+    filename, was_downloaded = hashin._download_release(url)
+    assert was_downloaded
+    assert filename == str(download_dir / "hashin-0.10.tar.gz")
+    assert (download_dir / "hashin-0.10.tar.gz").read_bytes() == (
+        b"Some hashin tarball\n"
+    )
+
+
+def test_run_pep_0496(pypi_mock, enum34_response, requirements_file):
     """
     Properly pass through specifiers which look like:
 
@@ -1916,104 +1405,39 @@ def test_run_pep_0496(murlopen, tmpfile):
     https://www.python.org/dev/peps/pep-0496/
     """
 
-    def mocked_get(url, **options):
-        if url == "https://pypi.org/pypi/enum34/json":
-            return _Response(
-                {
-                    "info": {"version": "1.1.6", "name": "enum34"},
-                    "releases": {
-                        "1.1.6": [
-                            {
-                                "has_sig": False,
-                                "upload_time": "2016-05-16T03:31:13",
-                                "comment_text": "",
-                                "python_version": "py2",
-                                "url": "https://pypi.org/packages/c5/db/enum34-1.1.6-py2-none-any.whl",
-                                "digests": {
-                                    "md5": "68f6982cc07dde78f4b500db829860bd",
-                                    "sha256": "aaaaa",
-                                },
-                                "md5_digest": "68f6982cc07dde78f4b500db829860bd",
-                                "downloads": 4297423,
-                                "filename": "enum34-1.1.6-py2-none-any.whl",
-                                "packagetype": "bdist_wheel",
-                                "path": "c5/db/enum34-1.1.6-py2-none-any.whl",
-                                "size": 12427,
-                            },
-                            {
-                                "has_sig": False,
-                                "upload_time": "2016-05-16T03:31:19",
-                                "comment_text": "",
-                                "python_version": "py3",
-                                "url": "https://pypi.org/packages/af/42/enum34-1.1.6-py3-none-any.whl",
-                                "md5_digest": "a63ecb4f0b1b85fb69be64bdea999b43",
-                                "digests": {
-                                    "md5": "a63ecb4f0b1b85fb69be64bdea999b43",
-                                    "sha256": "bbbbb",
-                                },
-                                "downloads": 98598,
-                                "filename": "enum34-1.1.6-py3-none-any.whl",
-                                "packagetype": "bdist_wheel",
-                                "path": "af/42/enum34-1.1.6-py3-none-any.whl",
-                                "size": 12428,
-                            },
-                            {
-                                "has_sig": False,
-                                "upload_time": "2016-05-16T03:31:30",
-                                "comment_text": "",
-                                "python_version": "source",
-                                "url": "https://pypi.org/packages/bf/3e/enum34-1.1.6.tar.gz",
-                                "md5_digest": "5f13a0841a61f7fc295c514490d120d0",
-                                "digests": {
-                                    "md5": "5f13a0841a61f7fc295c514490d120d0",
-                                    "sha256": "ccccc",
-                                },
-                                "downloads": 188090,
-                                "filename": "enum34-1.1.6.tar.gz",
-                                "packagetype": "sdist",
-                                "path": "bf/3e/enum34-1.1.6.tar.gz",
-                                "size": 40048,
-                            },
-                            {
-                                "has_sig": False,
-                                "upload_time": "2016-05-16T03:31:48",
-                                "comment_text": "",
-                                "python_version": "source",
-                                "url": "https://pypi.org/packages/e8/26/enum34-1.1.6.zip",
-                                "md5_digest": "61ad7871532d4ce2d77fac2579237a9e",
-                                "digests": {
-                                    "md5": "61ad7871532d4ce2d77fac2579237a9e",
-                                    "sha256": "dddddd",
-                                },
-                                "downloads": 775920,
-                                "filename": "enum34-1.1.6.zip",
-                                "packagetype": "sdist",
-                                "path": "e8/26/enum34-1.1.6.zip",
-                                "size": 44773,
-                            },
-                        ]
-                    },
-                }
-            )
-
-        raise NotImplementedError(url)
+    pypi_mock["https://pypi.org/pypi/enum34/json"] = enum34_response
 
-    murlopen.side_effect = mocked_get
+    retcode = hashin.run(
+        "enum34==1.1.6; python_version <= '3.4'",
+        requirements_file,
+        "sha256",
+        verbose=True,
+    )
 
-    with tmpfile() as filename:
-        with open(filename, "w") as f:
-            f.write("")
+    assert retcode == 0
+    output = requirements_file.getvalue()
+    assert output.endswith("\n")
+    lines = output.splitlines()
+    assert lines[0] == "enum34==1.1.6; python_version <= '3.4' \\"
+
+
+def test_parse_requirement():
+    req = hashin._parse_requirement("Hashin[extra]==0.10")
+    req.name = "hashin"
+    req.specifier = None
+    assert str(req) == "hashin[extra]"
+    # The cached one is left alone.
+    assert str(hashin._parse_requirement("Hashin[extra]==0.10")) == (
+        "Hashin[extra]==0.10"
+    )
 
-        retcode = hashin.run(
-            "enum34==1.1.6; python_version <= '3.4'", filename, "sha256", verbose=True
-        )
 
-        assert retcode == 0
-        with open(filename) as f:
-            output = f.read()
-        assert output.endswith("\n")
-        lines = output.splitlines()
-        assert lines[0] == "enum34==1.1.6; python_version <= '3.4' \\"
+def test_explode_package_spec():
+    assert hashin._explode_package_spec("hashin") == ("hashin", None, None)
+    assert hashin._explode_package_spec("hashin==0.10") == ("hashin", "0.10", None)
+    assert hashin._explode_package_spec(
+        'enum34==1.1.6 ;  python_version <= "3.4" and os_name == "posix"'
+    ) == ("enum34", "1.1.6", 'python_version <= "3.4" and os_name == "posix"')
 
 
 def test_filter_releases():
@@ -2152,6 +1576,13 @@ def test_release_url_metadata_python():
     }
 
 
+def test_release_url_metadata_is_a_copy():
+    url = "https://pypi.org/packages/2.7/p/pywin32/pywin32-219-cp27-none-win32.whl"
+    metadata = hashin.release_url_metadata(url)
+    metadata["python_version"] = "mutated"
+    assert hashin.release_url_metadata(url)["python_version"] == "cp27"
+
+
 def test_expand_python_version():
     assert sorted(hashin.expand_python_version("2.7")) == [
         "2.7",
@@ -2194,34 +1625,94 @@ def test_expand_python_version():
     ]
 
 
-def test_get_package_hashes(murlopen):
-    def mocked_get(url, **options):
-        if url == "https://pypi.org/pypi/hashin/json":
-            return _Response(
-                {
-                    "info": {"version": "0.10", "name": "hashin"},
-                    "releases": {
-                        "0.10": [
-                            {
-                                "url": "https://pypi.org/packages/2.7/p/hashin/hashin-0.10-py2-none-any.whl",
-                                "digests": {"sha256": "aaaaa"},
-                            },
-                            {
-                                "url": "https://pypi.org/packages/3.3/p/hashin/hashin-0.10-py3-none-any.whl",
-                                "digests": {"sha256": "bbbbb"},
-                            },
-                            {
-                                "url": "https://pypi.org/packages/source/p/hashin/hashin-0.10.tar.gz",
-                                "digests": {"sha256": "ccccc"},
-                            },
-                        ]
-                    },
-                }
-            )
+def test_get_package_data_cache(pypi_mock, tmp_path, monkeypatch, capsys):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    monkeypatch.setattr(hashin, "METADATA_CACHE_TTL", 300)
+    pypi_mock["https://pypi.org/pypi/hashin/json"] = _HASHIN_010_RESPONSE
+
+    data = hashin.get_package_data("hashin", "https://pypi.org/")
+    assert data["info"]["version"] == "0.10"
+
+    # PyPI isn't asked again while the cached copy is fresh.
+    pypi_mock["https://pypi.org/pypi/hashin/json"] = _Response(
+        {"info": {"version": "0.11", "name": "hashin"}, "releases": {}}
+    )
+    cached_data = hashin.get_package_data("hashin", "https://pypi.org/", verbose=True)
+    assert cached_data == data
+    (cached,) = tmp_path.glob("hashin/*.json")
+    assert capsys.readouterr().out == (
+        "* Package data https://pypi.org/pypi/hashin/json\n"
+        "*   Re-using {0}\n".format(cached)
+    )
+
+    # Only the user can write to the cache directory.
+    assert not (tmp_path / "hashin").stat().st_mode & 0o077
+
+    # But it is once the cached copy has expired.
+    expired = time.time() - 301
+    os.utime(cached, (expired, expired))
+    data = hashin.get_package_data("hashin", "https://pypi.org/")
+    assert data["info"]["version"] == "0.11"
 
-        raise NotImplementedError(url)
 
-    murlopen.side_effect = mocked_get
+def test_get_package_data_utf8_bytes(pypi_mock):
+    # The JSON is parsed straight from the response bytes, never decoded.
+    pypi_mock["https://pypi.org/pypi/hashin/json"] = _Response(
+        '{"info": {"name": "hashin", "summary": "Åäö ✓"}, "releases": {}}'.encode(
+            "utf-8"
+        )
+    )
+    data = hashin.get_package_data("hashin", "https://pypi.org/")
+    assert data["info"]["summary"] == "Åäö ✓"
+
+
+def test_get_package_data_cache_unwritable(pypi_mock, tmp_path, monkeypatch):
+    not_a_directory = tmp_path / "cache"
+    not_a_directory.touch()
+    monkeypatch.setenv("XDG_CACHE_HOME", str(not_a_directory))
+    monkeypatch.setattr(hashin, "METADATA_CACHE_TTL", 300)
+    pypi_mock["https://pypi.org/pypi/hashin/json"] = _HASHIN_010_RESPONSE
+
+    data = hashin.get_package_data("hashin", "https://pypi.org/")
+    assert data["info"]["version"] == "0.10"
+
+
+def test_get_package_data_cache_not_replaceable(pypi_mock, tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    monkeypatch.setattr(hashin, "METADATA_CACHE_TTL", 300)
+    pypi_mock["https://pypi.org/pypi/hashin/json"] = _HASHIN_010_RESPONSE
+    # A directory where the cache file should go can't be replaced.
+    cached = hashin._metadata_cache_filename("https://pypi.org/pypi/hashin/json")
+    os.makedirs(cached)
+
+    data = hashin.get_package_data("hashin", "https://pypi.org/")
+    assert data["info"]["version"] == "0.10"
+    # And the temporary file isn't left behind.
+    assert os.listdir(tmp_path / "hashin") == [os.path.basename(cached)]
+
+
+@pytest.mark.parametrize(
+    "corrupt",
+    [b'{"releases": {', b"", b'{"info": {"version": "0.9", "name": "hashin"}}'],
+)
+def test_get_package_data_cache_corrupt(pypi_mock, tmp_path, monkeypatch, corrupt):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    monkeypatch.setattr(hashin, "METADATA_CACHE_TTL", 300)
+    pypi_mock["https://pypi.org/pypi/hashin/json"] = _HASHIN_010_RESPONSE
+    cached = hashin._metadata_cache_filename("https://pypi.org/pypi/hashin/json")
+    os.makedirs(os.path.dirname(cached))
+    with open(cached, "wb") as f:
+        f.write(corrupt)
+
+    # It's fetched again, and the broken copy is replaced.
+    data = hashin.get_package_data("hashin", "https://pypi.org/")
+    assert data["info"]["version"] == "0.10"
+    with open(cached, "rb") as f:
+        assert json.loads(f.read()) == data
+
+
+def test_get_package_hashes(pypi_mock):
+    pypi_mock["https://pypi.org/pypi/hashin/json"] = _HASHIN_010_RESPONSE
 
     result = hashin.get_package_hashes(
         package="hashin", version="0.10", algorithm="sha256"
@@ -2236,34 +1727,28 @@ def test_get_package_hashes(murlopen):
     assert result == expected
 
 
-def test_get_package_hashes_from_alternate_index_url(murlopen):
-    def mocked_get(url, **options):
-        if url == "https://pypi.internal.net/pypi/hashin/json":
-            return _Response(
-                {
-                    "info": {"version": "0.10", "name": "hashin"},
-                    "releases": {
-                        "0.10": [
-                            {
-                                "url": "https://pypi.internal.net/packages/2.7/p/hashin/hashin-0.10-py2-none-any.whl",
-                                "digests": {"sha256": "ddddd"},
-                            },
-                            {
-                                "url": "https://pypi.internal.net/packages/3.3/p/hashin/hashin-0.10-py3-none-any.whl",
-                                "digests": {"sha256": "eeeee"},
-                            },
-                            {
-                                "url": "https://pypi.internal.net/packages/source/p/hashin/hashin-0.10.tar.gz",
-                                "digests": {"sha256": "fffff"},
-                            },
-                        ]
+def test_get_package_hashes_from_alternate_index_url(pypi_mock):
+    pypi_mock["https://pypi.internal.net/pypi/hashin/json"] = _Response(
+        {
+            "info": {"version": "0.10", "name": "hashin"},
+            "releases": {
+                "0.10": [
+                    {
+                        "url": "https://pypi.internal.net/packages/2.7/p/hashin/hashin-0.10-py2-none-any.whl",
+                        "digests": {"sha256": "ddddd"},
                     },
-                }
-            )
-
-        raise NotImplementedError(url)
-
-    murlopen.side_effect = mocked_get
+                    {
+                        "url": "https://pypi.internal.net/packages/3.3/p/hashin/hashin-0.10-py3-none-any.whl",
+                        "digests": {"sha256": "eeeee"},
+                    },
+                    {
+                        "url": "https://pypi.internal.net/packages/source/p/hashin/hashin-0.10.tar.gz",
+                        "digests": {"sha256": "fffff"},
+                    },
+                ]
+            },
+        }
+    )
 
     result = hashin.get_package_hashes(
         package="hashin",
@@ -2281,29 +1766,25 @@ def test_get_package_hashes_from_alternate_index_url(murlopen):
     assert result == expected
 
 
-def test_get_package_hashes_package_not_found(murlopen):
-    def mocked_get(url, **options):
-        if url == "https://pypi.org/pypi/gobblygook/json":
-            if HTTPError:
-                raise HTTPError(url, 404, "Page not found", {}, None)
-            else:
-                return _Response({}, status_code=404)
-
-        if url == "https://pypi.org/pypi/troublemaker/json":
-            if HTTPError:
-                raise HTTPError(url, 500, "Something went wrong", {}, None)
-            else:
-                return _Response({}, status_code=500)
-
-        raise NotImplementedError(url)
-
-    murlopen.side_effect = mocked_get
+def test_get_package_hashes_package_not_found(pypi_mock):
+    pypi_mock["https://pypi.org/pypi/gobblygook/json"] = HTTPError(
+        "https://pypi.org/pypi/gobblygook/json", 404, "Page not found", {}, None
+    )
+    pypi_mock["https://pypi.org/pypi/troublemaker/json"] = HTTPError(
+        "https://pypi.org/pypi/troublemaker/json",
+        500,
+        "Something went wrong",
+        {},
+        None,
+    )
 
-    with pytest.raises(hashin.PackageNotFoundError) as exc_info:
+    with pytest.raises(
+        hashin.PackageNotFoundError,
+        match=f"^{re.escape('https://pypi.org/pypi/gobblygook/json')}$",
+    ):
         hashin.get_package_hashes(
             package="gobblygook", version="0.10", algorithm="sha256"
         )
-    assert str(exc_info.value) == "https://pypi.org/pypi/gobblygook/json"
 
     # Errors left as is if not a 404
     with pytest.raises(hashin.PackageError):
@@ -2312,44 +1793,9 @@ def test_get_package_hashes_package_not_found(murlopen):
         )
 
 
-def test_get_package_hashes_unknown_algorithm(murlopen, capsys):
-    def mocked_get(url, **options):
-        if url == "https://pypi.org/pypi/hashin/json":
-            return _Response(
-                {
-                    "info": {"version": "0.10", "name": "hashin"},
-                    "releases": {
-                        "0.10": [
-                            {
-                                "url": "https://pypi.org/packages/2.7/p/hashin/hashin-0.10-py2-none-any.whl",
-                                "digests": {"sha256": "aaaaa"},
-                            },
-                            {
-                                "url": "https://pypi.org/packages/3.3/p/hashin/hashin-0.10-py3-none-any.whl",
-                                "digests": {"sha256": "bbbbb"},
-                            },
-                            {
-                                "url": "https://pypi.org/packages/source/p/hashin/hashin-0.10.tar.gz",
-                                "digests": {"sha256": "ccccc"},
-                            },
-                        ]
-                    },
-                }
-            )
-        elif (
-            url == "https://pypi.org/packages/2.7/p/hashin/hashin-0.10-py2-none-any.whl"
-        ):
-            return _Response(b"Some py2 wheel content\n")
-        elif (
-            url == "https://pypi.org/packages/3.3/p/hashin/hashin-0.10-py3-none-any.whl"
-        ):
-            return _Response(b"Some py3 wheel content\n")
-        elif url == "https://pypi.org/packages/source/p/hashin/hashin-0.10.tar.gz":
-            return _Response(b"Some tarball content\n")
-
-        raise NotImplementedError(url)
-
-    murlopen.side_effect = mocked_get
+def test_get_package_hashes_unknown_algorithm(pypi_mock, capsys):
+    pypi_mock["https://pypi.org/pypi/hashin/json"] = _HASHIN_010_RESPONSE
+    pypi_mock.update(_hashin_010_files())
 
     result = hashin.get_package_hashes(
         package="hashin", version="0.10", algorithm="sha512", verbose=True
@@ -2380,41 +1826,14 @@ def test_get_package_hashes_unknown_algorithm(murlopen, capsys):
     assert result == expected
 
 
-def test_get_package_hashes_without_version(murlopen, capsys):
-    def mocked_get(url, **options):
-        if url == "https://pypi.org/pypi/hashin/json":
-            return _Response(
-                {
-                    "info": {"version": "0.10", "name": "hashin"},
-                    "releases": {
-                        "0.10": [
-                            {
-                                "url": "https://pypi.org/packages/2.7/p/hashin/hashin-0.10-py2-none-any.whl",
-                                "digests": {"sha256": "aaaaa"},
-                            },
-                            {
-                                "url": "https://pypi.org/packages/3.3/p/hashin/hashin-0.10-py3-none-any.whl",
-                                "digests": {"sha256": "bbbbb"},
-                            },
-                            {
-                                "url": "https://pypi.org/packages/source/p/hashin/hashin-0.10.tar.gz",
-                                "digests": {"sha256": "ccccc"},
-                            },
-                        ]
-                    },
-                }
-            )
-        elif url == "https://pypi.org/pypi/uggamugga/json":
-            return _Response(
-                {
-                    "info": {"version": "1.2.3", "name": "uggamugga"},
-                    "releases": {},  # Note!
-                }
-            )
-
-        raise NotImplementedError(url)
-
-    murlopen.side_effect = mocked_get
+def test_get_package_hashes_without_version(pypi_mock, capsys):
+    pypi_mock["https://pypi.org/pypi/hashin/json"] = _HASHIN_010_RESPONSE
+    pypi_mock["https://pypi.org/pypi/uggamugga/json"] = _Response(
+        {
+            "info": {"version": "1.2.3", "name": "uggamugga"},
+            "releases": {},  # Note!
+        }
+    )
 
     result = hashin.get_package_hashes(package="hashin", verbose=True)
     assert result["package"] == "hashin"
@@ -2438,34 +1857,28 @@ def test_get_package_hashes_without_version(murlopen, capsys):
         hashin.get_package_hashes(package="uggamugga")
 
 
-def test_get_package_hashes_consistant_order(murlopen):
-    def mocked_get(url, **options):
-        if url == "https://pypi.org/pypi/hashin/json":
-            return _Response(
-                {
-                    "info": {"version": "0.10", "name": "hashin"},
-                    "releases": {
-                        "0.10": [
-                            {
-                                "url": "https://pypi.org/packages/3.3/p/hashin/hashin-0.10-py3-none-any.whl",
-                                "digests": {"sha256": "bbbbb"},
-                            },
-                            {
-                                "url": "https://pypi.org/packages/source/p/hashin/hashin-0.10.tar.gz",
-                                "digests": {"sha256": "ccccc"},
-                            },
-                            {
-                                "url": "https://pypi.org/packages/2.7/p/hashin/hashin-0.10-py2-none-any.whl",
-                                "digests": {"sha256": "aaaaa"},
-                            },
-                        ]
+def test_get_package_hashes_consistant_order(pypi_mock):
+    pypi_mock["https://pypi.org/pypi/hashin/json"] = _Response(
+        {
+            "info": {"version": "0.10", "name": "hashin"},
+            "releases": {
+                "0.10": [
+                    {
+                        "url": "https://pypi.org/packages/3.3/p/hashin/hashin-0.10-py3-none-any.whl",
+                        "digests": {"sha256": "bbbbb"},
                     },
-                }
-            )
-
-        raise NotImplementedError(url)
-
-    murlopen.side_effect = mocked_get
+                    {
+                        "url": "https://pypi.org/packages/source/p/hashin/hashin-0.10.tar.gz",
+                        "digests": {"sha256": "ccccc"},
+                    },
+                    {
+                        "url": "https://pypi.org/packages/2.7/p/hashin/hashin-0.10-py2-none-any.whl",
+                        "digests": {"sha256": "aaaaa"},
+                    },
+                ]
+            },
+        }
+    )
 
     result = hashin.get_package_hashes(
         package="hashin", version="0.10", algorithm="sha256"
@@ -2480,7 +1893,7 @@ def test_get_package_hashes_consistant_order(murlopen):
     assert result == expected
 
 
-def test_with_extras_syntax(murlopen, tmpfile):
+def test_with_extras_syntax(pypi_mock, requirements_file):
     """When you want to add the hashes of a package by using the
     "extras notation". E.g `requests[security]`.
     In this case, it should basically ignore the `[security]` part when
@@ -2488,186 +1901,57 @@ def test_with_extras_syntax(murlopen, tmpfile):
     into the requirements file.
     """
 
-    def mocked_get(url, **options):
-        if url == "https://pypi.org/pypi/hashin/json":
-            return _Response(
-                {
-                    "info": {"version": "0.10", "name": "hashin"},
-                    "releases": {
-                        "0.10": [
-                            {
-                                "url": "https://pypi.org/packages/source/p/hashin/hashin-0.10.tar.gz",
-                                "digests": {"sha256": "ccccc"},
-                            }
-                        ]
-                    },
-                }
-            )
-        raise NotImplementedError(url)
-
-    murlopen.side_effect = mocked_get
-
-    with tmpfile() as filename:
-        with open(filename, "w") as f:
-            f.write("")
-
-        retcode = hashin.run("hashin[stuff]", filename, "sha256")
-
-        assert retcode == 0
-        with open(filename) as f:
-            output = f.read()
-        assert "hashin[stuff]==0.10" in output
-
-
-def test_extras_syntax_edit(murlopen, tmpfile):
-    def mocked_get(url, **options):
-        if url == "https://pypi.org/pypi/hashin/json":
-            return _Response(
-                {
-                    "info": {"version": "0.10", "name": "hashin"},
-                    "releases": {
-                        "0.10": [
-                            {
-                                "url": "https://pypi.org/packages/source/p/hashin/hashin-0.10.tar.gz",
-                                "digests": {"sha256": "ccccc"},
-                            }
-                        ]
-                    },
-                }
-            )
-        raise NotImplementedError(url)
-
-    murlopen.side_effect = mocked_get
-
-    with tmpfile() as filename:
-        with open(filename, "w") as f:
-            f.write("hashin==0.10\n")
-            f.write("    --hash=sha256:ccccc\n")
-
-        retcode = hashin.run("hashin[stuff]", filename, "sha256")
-
-        assert retcode == 0
-        with open(filename) as f:
-            output = f.read()
-        assert "hashin[stuff]==0.10" in output
-        assert "hashin==0.10" not in output
-
-
-def test_add_extra_extras_syntax_edit(murlopen, tmpfile):
-    def mocked_get(url, **options):
-        if url == "https://pypi.org/pypi/hashin/json":
-            return _Response(
-                {
-                    "info": {"version": "0.10", "name": "hashin"},
-                    "releases": {
-                        "0.10": [
-                            {
-                                "url": "https://pypi.org/packages/source/p/hashin/hashin-0.10.tar.gz",
-                                "digests": {"sha256": "ccccc"},
-                            }
-                        ]
-                    },
-                }
-            )
-        raise NotImplementedError(url)
-
-    murlopen.side_effect = mocked_get
-
-    with tmpfile() as filename:
-        with open(filename, "w") as f:
-            f.write("hashin[stuff]==0.10\n")
-            f.write("    --hash=sha256:ccccc\n")
-
-        retcode = hashin.run("hashin[extra,stuff]", filename, "sha256")
-
-        assert retcode == 0
-        with open(filename) as f:
-            output = f.read()
-        assert "hashin[extra,stuff]==0.10" in output
-        assert "hashin==0.10" not in output
-        assert "hashin[stuff]==0.10" not in output
-        assert "hashin[extra]==0.10" not in output
-
-
-def test_change_extra_extras_syntax_edit(murlopen, tmpfile):
-    def mocked_get(url, **options):
-        if url == "https://pypi.org/pypi/hashin/json":
-            return _Response(
-                {
-                    "info": {"version": "0.10", "name": "hashin"},
-                    "releases": {
-                        "0.10": [
-                            {
-                                "url": "https://pypi.org/packages/source/p/hashin/hashin-0.10.tar.gz",
-                                "digests": {"sha256": "ccccc"},
-                            }
-                        ]
-                    },
-                }
-            )
-        raise NotImplementedError(url)
-
-    murlopen.side_effect = mocked_get
-
-    with tmpfile() as filename:
-        with open(filename, "w") as f:
-            f.write("hashin[stuff]==0.10\n")
-            f.write("    --hash=sha256:ccccc\n")
-
-        retcode = hashin.run("hashin[different]", filename, "sha256")
+    pypi_mock["https://pypi.org/pypi/hashin/json"] = _sdist_response(
+        "hashin", ("0.10", "ccccc")
+    )
 
-        assert retcode == 0
-        with open(filename) as f:
-            output = f.read()
-        assert "hashin[different]==0.10" in output
-        assert "hashin[stuff]==0.10" not in output
+    retcode = hashin.run("hashin[stuff]", requirements_file, "sha256")
 
+    assert retcode == 0
+    assert requirements_file.getvalue() == (
+        "hashin[stuff]==0.10 \\\n    --hash=sha256:ccccc\n"
+    )
 
-def test_remove_extra_extras_syntax_edit(murlopen, tmpfile):
-    def mocked_get(url, **options):
-        if url == "https://pypi.org/pypi/hashin/json":
-            return _Response(
-                {
-                    "info": {"version": "0.10", "name": "hashin"},
-                    "releases": {
-                        "0.10": [
-                            {
-                                "url": "https://pypi.org/packages/source/p/hashin/hashin-0.10.tar.gz",
-                                "digests": {"sha256": "ccccc"},
-                            }
-                        ]
-                    },
-                }
-            )
-        raise NotImplementedError(url)
 
-    murlopen.side_effect = mocked_get
+@pytest.mark.parametrize(
+    "before, spec, after",
+    [
+        # Adding extras
+        ("hashin", "hashin[stuff]", "hashin[stuff]"),
+        # Adding another extra
+        ("hashin[stuff]", "hashin[extra,stuff]", "hashin[extra,stuff]"),
+        # Changing the extra
+        ("hashin[stuff]", "hashin[different]", "hashin[different]"),
+        # Removing the extras
+        ("hashin[stuff]", "hashin", "hashin"),
+    ],
+)
+def test_extras_syntax_edit(pypi_mock, requirements_file, before, spec, after):
+    pypi_mock["https://pypi.org/pypi/hashin/json"] = _sdist_response(
+        "hashin", ("0.10", "ccccc")
+    )
 
-    with tmpfile() as filename:
-        with open(filename, "w") as f:
-            f.write("hashin[stuff]==0.10\n")
-            f.write("    --hash=sha256:ccccc\n")
+    requirements_file.write(f"{before}==0.10\n    --hash=sha256:ccccc\n")
 
-        retcode = hashin.run("hashin", filename, "sha256")
+    retcode = hashin.run(spec, requirements_file, "sha256")
 
-        assert retcode == 0
-        with open(filename) as f:
-            output = f.read()
-        assert "hashin==0.10" in output
-        assert "hashin[stuff]==0.10" not in output
+    assert retcode == 0
+    assert requirements_file.getvalue() == (
+        f"{after}==0.10 \\\n    --hash=sha256:ccccc\n"
+    )
 
 
-def test_interactive_upgrade_request(capsys):
+def test_interactive_upgrade_request(mock_input, capsys):
     old = Requirement("hashin==0.9")
     old_version = old.specifier
     new = Requirement("hashin==0.10")
     new_version = new.specifier
 
-    with mock.patch("hashin.input", return_value="Y "):
-        result = hashin.interactive_upgrade_request(
-            "hashin", old_version, new_version, print_header=True
-        )
-        assert result == "YES"
+    mock_input.return_value = "Y "
+    result = hashin.interactive_upgrade_request(
+        "hashin", old_version, new_version, print_header=True
+    )
+    assert result == "YES"
 
     captured = capsys.readouterr()
     assert "PACKAGE" in captured.out
@@ -2677,9 +1961,9 @@ def test_interactive_upgrade_request(capsys):
     assert "✓" in captured.out
 
     # This time, say no.
-    with mock.patch("hashin.input", return_value="N"):
-        result = hashin.interactive_upgrade_request("hashin", old_version, new_version)
-        assert result == "NO"
+    mock_input.return_value = "N"
+    result = hashin.interactive_upgrade_request("hashin", old_version, new_version)
+    assert result == "NO"
 
     captured = capsys.readouterr()
     assert "PACKAGE" not in captured.out
@@ -2687,20 +1971,21 @@ def test_interactive_upgrade_request(capsys):
     assert " 0.9 " in captured.out
     assert " 0.10 " in captured.out
     assert "✘" in captured.out
+    # The question line and the one before it are cleared.
+    assert "\033[F\033[K\033[F\033[K" in captured.out
 
     # This time, say yes to everything.
-    with mock.patch("hashin.input", return_value="A"):
-        result = hashin.interactive_upgrade_request("hashin", old_version, new_version)
-        assert result == "ALL"
+    mock_input.return_value = "A"
+    result = hashin.interactive_upgrade_request("hashin", old_version, new_version)
+    assert result == "ALL"
 
     captured = capsys.readouterr()
     assert "hashin " in captured.out
 
     # This time, quit it.
-    # This time, say yes to everything.
-    with mock.patch("hashin.input", return_value="q "):
-        result = hashin.interactive_upgrade_request("hashin", old_version, new_version)
-        assert result == "QUIT"
+    mock_input.return_value = "q "
+    result = hashin.interactive_upgrade_request("hashin", old_version, new_version)
+    assert result == "QUIT"
 
     captured = capsys.readouterr()
     assert "hashin " in captured.out
@@ -2708,65 +1993,63 @@ def test_interactive_upgrade_request(capsys):
     assert "?\n" in captured.out
 
 
-def test_interactive_upgrade_request_repeat_question(capsys):
+def test_interactive_upgrade_request_repeat_question(mock_input):
     old = Requirement("hashin==0.9")
     old_version = old.specifier
     new = Requirement("hashin==0.10")
     new_version = new.specifier
 
-    questions = []
-
-    def mock_input(question):
-        questions.append(question)
-        if len(questions) == 1:
-            return "X"  # anything not recognized
-        elif len(questions) == 2:
-            return "Y"
-        raise NotImplementedError(questions)
+    # Anything not recognized asks the question again.
+    mock_input.side_effect = ["X", "Y"]
+    result = hashin.interactive_upgrade_request("hashin", old_version, new_version)
+    assert result == "YES"
 
-    with mock.patch("hashin.input") as mocked_input:
-        mocked_input.side_effect = mock_input
-        result = hashin.interactive_upgrade_request("hashin", old_version, new_version)
-        assert result == "YES"
 
-
-def test_interactive_upgrade_request_help(capsys):
+def test_interactive_upgrade_request_help(mock_input):
     old = Requirement("hashin==0.9")
     old_version = old.specifier
     new = Requirement("hashin==0.10")
     new_version = new.specifier
 
-    questions = []
-
-    def mock_input(question):
-        questions.append(question)
-        if len(questions) == 1:
-            return "?"
-        elif len(questions) == 2:
-            return "Y"
-        raise NotImplementedError(questions)
+    mock_input.side_effect = ["?", "Y"]
+    result = hashin.interactive_upgrade_request("hashin", old_version, new_version)
+    assert result == "YES"
 
-    with mock.patch("hashin.input") as mocked_input:
-        mocked_input.side_effect = mock_input
-        result = hashin.interactive_upgrade_request("hashin", old_version, new_version)
-        assert result == "YES"
 
-
-def test_interactive_upgrade_request_force_yes(capsys):
+def test_interactive_upgrade_request_force_yes(mock_input):
     old = Requirement("hashin==0.9")
     old_version = old.specifier
     new = Requirement("hashin==0.10")
     new_version = new.specifier
 
-    def mock_input(question):
-        raise AssertionError("Shouldn't ask any questions")
-
-    with mock.patch("hashin.input") as mocked_input:
-        mocked_input.side_effect = mock_input
-        result = hashin.interactive_upgrade_request(
-            "hashin", old_version, new_version, force_yes=True
-        )
-        assert result == "YES"
+    mock_input.side_effect = AssertionError("Shouldn't ask any questions")
+    result = hashin.interactive_upgrade_request(
+        "hashin", old_version, new_version, force_yes=True
+    )
+    assert result == "YES"
+
+
+# readme_renderer as TestIssue116 pins it, without and with environment markers.
+_README_RENDERER_25 = (
+    "readme_renderer==25.0 \\\n"
+    "    --hash=sha256:1b6d8dd1673a0b293766b4106af766b6eff3654605f9c4f239e65de6076bc222 \\\n"
+    "    --hash=sha256:e67d64242f0174a63c3b727801a2fff4c1f38ebe5d71d95ff7ece081945a6cd4\n"
+)
+_README_RENDERER_25_MARKERS = (
+    'readme_renderer==25.0; python_version <= "3.4" \\\n'
+    "    --hash=sha256:1b6d8dd1673a0b293766b4106af766b6eff3654605f9c4f239e65de6076bc222 \\\n"
+    "    --hash=sha256:e67d64242f0174a63c3b727801a2fff4c1f38ebe5d71d95ff7ece081945a6cd4\n"
+)
+_README_RENDERER_26 = (
+    "readme-renderer==26.0 \\\n"
+    "    --hash=sha256:cbe9db71defedd2428a1589cdc545f9bd98e59297449f69d721ef8f1cfced68d \\\n"
+    "    --hash=sha256:cc4957a803106e820d05d14f71033092537a22daa4f406dfbdd61177e0936376\n"
+)
+_README_RENDERER_26_MARKERS = (
+    'readme-renderer==26.0; python_version <= "3.4" \\\n'
+    "    --hash=sha256:cbe9db71defedd2428a1589cdc545f9bd98e59297449f69d721ef8f1cfced68d \\\n"
+    "    --hash=sha256:cc4957a803106e820d05d14f71033092537a22daa4f406dfbdd61177e0936376\n"
+)
 
 
 class TestIssue116:
@@ -2776,213 +2059,105 @@ class TestIssue116:
     """
 
     def test_amend_requirements_content_new_without_env_markers(self):
-        requirements = (
-            """
-# empty so far
-        """.strip()
-            + "\n"
-        )
+        requirements = "# empty so far\n"
         new_lines = (
             "discogs-client",
             "discogs-client",
-            """
-discogs-client==1.1 \\
-    --hash=sha256:4d64ed1b9e0e73095f5cfa87f0e97ddb4c840049e8efeb7e63b46118ba1d623a
-        """.strip()
-            + "\n",
+            "discogs-client==1.1 \\\n"
+            "    --hash=sha256:4d64ed1b9e0e73095f5cfa87f0e97ddb4c840049e8efeb7e63b46118ba1d623a\n",
         )
         result = hashin.amend_requirements_content(requirements, [new_lines])
         assert result == requirements + new_lines[2]
 
     def test_amend_requirements_content_new_with_env_markers(self):
-        requirements = (
-            """
-# empty so far
-        """.strip()
-            + "\n"
-        )
+        requirements = "# empty so far\n"
         new_lines = (
             "discogs-client; python_version <= '3.4'",
             "discogs-client; python_version <= '3.4'",
-            """
-discogs-client==1.1; python_version <= '3.4' \\
-    --hash=sha256:4d64ed1b9e0e73095f5cfa87f0e97ddb4c840049e8efeb7e63b46118ba1d623a
-        """.strip()
-            + "\n",
+            "discogs-client==1.1; python_version <= '3.4' \\\n"
+            "    --hash=sha256:4d64ed1b9e0e73095f5cfa87f0e97ddb4c840049e8efeb7e63b46118ba1d623a\n",
         )
         result = hashin.amend_requirements_content(requirements, [new_lines])
         assert result == requirements + new_lines[2]
 
     def test_amend_requirements_different_old_name_without_env_markers(self):
-        requirements = (
-            """
-readme_renderer==25.0 \\
-    --hash=sha256:1b6d8dd1673a0b293766b4106af766b6eff3654605f9c4f239e65de6076bc222 \\
-    --hash=sha256:e67d64242f0174a63c3b727801a2fff4c1f38ebe5d71d95ff7ece081945a6cd4
-
-        """.strip()
-            + "\n"
-        )
-
-        new_lines = (
-            "readme-renderer",
-            "readme-renderer",
-            """
-readme-renderer==26.0 \\
-    --hash=sha256:cbe9db71defedd2428a1589cdc545f9bd98e59297449f69d721ef8f1cfced68d \\
-    --hash=sha256:cc4957a803106e820d05d14f71033092537a22daa4f406dfbdd61177e0936376
-
-        """.strip()
-            + "\n",
-        )
-        result = hashin.amend_requirements_content(requirements, [new_lines])
-        assert result == new_lines[2]
+        new_lines = ("readme-renderer", "readme-renderer", _README_RENDERER_26)
+        result = hashin.amend_requirements_content(_README_RENDERER_25, [new_lines])
+        assert result == _README_RENDERER_26
 
     def test_amend_requirements_different_old_name_with_env_markers(self):
-        requirements = (
-            """
-readme_renderer==25.0; python_version <= "3.4" \\
-    --hash=sha256:1b6d8dd1673a0b293766b4106af766b6eff3654605f9c4f239e65de6076bc222 \\
-    --hash=sha256:e67d64242f0174a63c3b727801a2fff4c1f38ebe5d71d95ff7ece081945a6cd4
-
-        """.strip()
-            + "\n"
-        )
-
-        new_lines = (
-            "readme-renderer",
-            "readme-renderer",
-            """
-readme-renderer==26.0; python_version <= "3.4" \\
-    --hash=sha256:cbe9db71defedd2428a1589cdc545f9bd98e59297449f69d721ef8f1cfced68d \\
-    --hash=sha256:cc4957a803106e820d05d14f71033092537a22daa4f406dfbdd61177e0936376
-
-        """.strip()
-            + "\n",
+        new_lines = ("readme-renderer", "readme-renderer", _README_RENDERER_26_MARKERS)
+        result = hashin.amend_requirements_content(
+            _README_RENDERER_25_MARKERS, [new_lines]
         )
-        result = hashin.amend_requirements_content(requirements, [new_lines])
-        assert result == new_lines[2]
+        assert result == _README_RENDERER_26_MARKERS
 
     def test_amend_requirements_without_env_markers_same_version(self):
-        requirements = (
-            """
-readme_renderer==25.0 \\
-    --hash=sha256:1b6d8dd1673a0b293766b4106af766b6eff3654605f9c4f239e65de6076bc222 \\
-    --hash=sha256:e67d64242f0174a63c3b727801a2fff4c1f38ebe5d71d95ff7ece081945a6cd4
+        new_lines = ("readme-renderer", "readme-renderer", _README_RENDERER_25)
+        result = hashin.amend_requirements_content(_README_RENDERER_25, [new_lines])
+        assert result == _README_RENDERER_25
 
-        """.strip()
-            + "\n"
+    def test_amend_requirements_with_env_markers_same_version(self):
+        new_lines = ("readme-renderer", "readme-renderer", _README_RENDERER_25_MARKERS)
+        result = hashin.amend_requirements_content(
+            _README_RENDERER_25_MARKERS, [new_lines]
         )
+        assert result == _README_RENDERER_25_MARKERS
 
-        new_lines = (
-            "readme-renderer",
-            "readme-renderer",
-            """
-readme_renderer==25.0 \\
-    --hash=sha256:1b6d8dd1673a0b293766b4106af766b6eff3654605f9c4f239e65de6076bc222 \\
-    --hash=sha256:e67d64242f0174a63c3b727801a2fff4c1f38ebe5d71d95ff7ece081945a6cd4
-
-        """.strip()
-            + "\n",
+    def test_run_old_name_no_version_change(self, pypi_mock, requirements_file):
+        pypi_mock["https://pypi.org/pypi/readme_renderer/json"] = _Response(
+            {
+                "info": {"version": "0.25", "name": "readme-renderer"},
+                "releases": {
+                    "25.0": [
+                        {
+                            "url": "https://pypi.org/packages/source/p/readme-renderer/readme_renderer-25.0.tar.gz",
+                            "digests": {"sha256": "bbbbb"},
+                        }
+                    ],
+                    "26.0": [
+                        {
+                            "url": "https://pypi.org/packages/source/p/readme-renderer/readme_renderer-26.0.tar.gz",
+                            "digests": {"sha256": "aaaaa"},
+                        }
+                    ],
+                },
+            }
         )
-        result = hashin.amend_requirements_content(requirements, [new_lines])
-        assert result == requirements
 
-    def test_amend_requirements_with_env_markers_same_version(self):
-        requirements = (
-            """
-readme_renderer==25.0; python_version <= "3.4" \\
-    --hash=sha256:1b6d8dd1673a0b293766b4106af766b6eff3654605f9c4f239e65de6076bc222 \\
-    --hash=sha256:e67d64242f0174a63c3b727801a2fff4c1f38ebe5d71d95ff7ece081945a6cd4
+        requirements_file.write("readme_renderer==25.0 \\\n    --hash=sha256:bbbbb\n\n")
 
-        """.strip()
-            + "\n"
+        retcode = hashin.run("readme_renderer==25.0", requirements_file, "sha256")
+        assert retcode == 0
+        assert requirements_file.getvalue() == (
+            "readme_renderer==25.0 \\\n    --hash=sha256:bbbbb\n\n"
         )
 
-        new_lines = (
-            "readme-renderer",
-            "readme-renderer",
-            """
-readme_renderer==25.0; python_version <= "3.4" \\
-    --hash=sha256:1b6d8dd1673a0b293766b4106af766b6eff3654605f9c4f239e65de6076bc222 \\
-    --hash=sha256:e67d64242f0174a63c3b727801a2fff4c1f38ebe5d71d95ff7ece081945a6cd4
-
-        """.strip()
-            + "\n",
+    def test_run_old_name_new_version_change(self, pypi_mock, requirements_file):
+        pypi_mock["https://pypi.org/pypi/readme_renderer/json"] = _Response(
+            {
+                "info": {"version": "0.25", "name": "readme-renderer"},
+                "releases": {
+                    "25.0": [
+                        {
+                            "url": "https://pypi.org/packages/source/p/readme-renderer/readme_renderer-25.0.tar.gz",
+                            "digests": {"sha256": "bbbbb"},
+                        }
+                    ],
+                    "26.0": [
+                        {
+                            "url": "https://pypi.org/packages/source/p/readme-renderer/readme_renderer-26.0.tar.gz",
+                            "digests": {"sha256": "aaaaa"},
+                        }
+                    ],
+                },
+            }
         )
-        result = hashin.amend_requirements_content(requirements, [new_lines])
-        assert result == requirements
-
-    def test_run_old_name_no_version_change(self, murlopen, tmpfile, capsys):
-        def mocked_get(url, **options):
-            if url == "https://pypi.org/pypi/readme_renderer/json":
-                return _Response(
-                    {
-                        "info": {"version": "0.25", "name": "readme-renderer"},
-                        "releases": {
-                            "25.0": [
-                                {
-                                    "url": "https://pypi.org/packages/source/p/readme-renderer/readme_renderer-25.0.tar.gz",
-                                    "digests": {"sha256": "bbbbb"},
-                                }
-                            ],
-                            "26.0": [
-                                {
-                                    "url": "https://pypi.org/packages/source/p/readme-renderer/readme_renderer-26.0.tar.gz",
-                                    "digests": {"sha256": "aaaaa"},
-                                }
-                            ],
-                        },
-                    }
-                )
-
-        murlopen.side_effect = mocked_get
-
-        with tmpfile() as filename:
-            with open(filename, "w") as f:
-                f.write("readme_renderer==25.0 \\\n")
-                f.write("    --hash=sha256:bbbbb\n")
-                f.write("\n")
-
-            retcode = hashin.run("readme_renderer==25.0", filename, "sha256")
-            assert retcode == 0
-            with open(filename) as f:
-                output = f.read()
-            assert "readme_renderer==25.0" in output
-
-    def test_run_old_name_new_version_change(self, murlopen, tmpfile, capsys):
-        def mocked_get(url, **options):
-            if url == "https://pypi.org/pypi/readme_renderer/json":
-                return _Response(
-                    {
-                        "info": {"version": "0.25", "name": "readme-renderer"},
-                        "releases": {
-                            "25.0": [
-                                {
-                                    "url": "https://pypi.org/packages/source/p/readme-renderer/readme_renderer-25.0.tar.gz",
-                                    "digests": {"sha256": "bbbbb"},
-                                }
-                            ],
-                            "26.0": [
-                                {
-                                    "url": "https://pypi.org/packages/source/p/readme-renderer/readme_renderer-26.0.tar.gz",
-                                    "digests": {"sha256": "aaaaa"},
-                                }
-                            ],
-                        },
-                    }
-                )
-
-        murlopen.side_effect = mocked_get
 
-        with tmpfile() as filename:
-            with open(filename, "w") as f:
-                f.write("readme_renderer==26.0 \\\n")
-                f.write("    --hash=sha256:bbbbb\n")
-                f.write("\n")
+        requirements_file.write("readme_renderer==26.0 \\\n    --hash=sha256:bbbbb\n\n")
 
-            retcode = hashin.run("readme_renderer==26.0", filename, "sha256")
-            assert retcode == 0
-            with open(filename) as f:
-                output = f.read()
-            assert "readme-renderer==26.0" in output
+        retcode = hashin.run("readme_renderer==26.0", requirements_file, "sha256")
+        assert retcode == 0
+        assert requirements_file.getvalue() == (
+            "readme-renderer==26.0 \\\n    --hash=sha256:aaaaa\n\n"
+        )